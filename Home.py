@@ -93,7 +93,7 @@ with st.sidebar:
                 os.environ["MISTRAL_API_KEY"] = api_key
                 st.session_state.api_key_set = True
                 st.success("API Key saved!")
-                st.experimental_rerun()
+                st.rerun()
             else:
                 st.error("Please enter a valid API Key")
     else:
@@ -102,7 +102,7 @@ with st.sidebar:
             if "MISTRAL_API_KEY" in os.environ:
                 del os.environ["MISTRAL_API_KEY"]
             st.session_state.api_key_set = False
-            st.experimental_rerun()
+            st.rerun()
     
     st.markdown("---")
     st.markdown("Navigate to different pages using the sidebar menu")
@@ -1,13 +1,45 @@
 import os
-import json
 import logging
 from pathlib import Path
 from mistralai import Mistral
-from helper_functions import load_config
+from helper_functions import load_config, json_loads, json_dumps
 
 # Initialize logger
 logger = logging.getLogger("chatbot.conversation_flow")
 
+# JSON schema for serialized conversation flows (see ConversationFlow.to_dict)
+STAGE_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "stage_id": {"type": "string"},
+        "name": {"type": "string"},
+        "system_prompt": {"type": "string"},
+        "user_prompt": {"type": ["string", "null"]},
+        "next_stages": {"type": "array", "items": {"type": "string"}},
+        "completion_criteria": {"type": "object", "additionalProperties": {"type": "string"}},
+        "max_turns": {"type": "integer", "minimum": 1}
+    }
+}
+
+FLOW_JSON_SCHEMA = {
+    "type": "object",
+    "required": ["flow_id", "name"],
+    "properties": {
+        "flow_id": {"type": "string", "minLength": 1},
+        "name": {"type": "string"},
+        "description": {"type": "string"},
+        "initial_stage": {"type": ["string", "null"]},
+        "stages": {"type": "object", "additionalProperties": STAGE_JSON_SCHEMA}
+    }
+}
+
+# Compile the schema into a validator once at import time when fastjsonschema is installed
+try:
+    import fastjsonschema
+    _flow_validator = fastjsonschema.compile(FLOW_JSON_SCHEMA)
+except ImportError:
+    _flow_validator = None
+
 class ConversationStage:
     """Class representing a stage in a conversation flow"""
     def __init__(self, stage_id, name, system_prompt, user_prompt=None, 
@@ -144,6 +176,29 @@ class ConversationState:
         )
 
 
+def validate_flow_data(data):
+    """
+    Validate serialized flow data before building a ConversationFlow from it
+    
+    Raises:
+        ValueError: If the data does not match FLOW_JSON_SCHEMA
+    """
+    if _flow_validator is not None:
+        _flow_validator(data)
+        return
+    
+    # Minimal structural check when fastjsonschema is not available
+    if not isinstance(data, dict):
+        raise ValueError("Flow data must be a JSON object")
+    if not isinstance(data.get("flow_id"), str) or not data["flow_id"]:
+        raise ValueError("Flow data must contain a non-empty 'flow_id'")
+    if not isinstance(data.get("name"), str):
+        raise ValueError("Flow data must contain a 'name'")
+    stages = data.get("stages", {})
+    if not isinstance(stages, dict) or not all(isinstance(stage, dict) for stage in stages.values()):
+        raise ValueError("Flow 'stages' must be an object mapping stage IDs to stages")
+
+
 def get_mistral_client():
     """Get Mistral client instance"""
     api_key = os.environ.get("MISTRAL_API_KEY", "")
@@ -288,8 +343,8 @@ def save_conversation_flow(flow, directory="conversation_flows"):
     flow_path = flow_dir / f"{flow.flow_id}.json"
     
     try:
-        with open(flow_path, "w") as f:
-            json.dump(flow.to_dict(), f, indent=2)
+        with open(flow_path, "wb") as f:
+            f.write(json_dumps(flow.to_dict()))
         return True
     except Exception as e:
         logger.error(f"Error saving conversation flow: {str(e)}")
@@ -305,8 +360,7 @@ def load_conversation_flow(flow_id, directory="conversation_flows"):
         return None
     
     try:
-        with open(flow_path, "r") as f:
-            data = json.load(f)
+        data = json_loads(flow_path.read_bytes())
         return ConversationFlow.from_dict(data)
     except Exception as e:
         logger.error(f"Error loading conversation flow: {str(e)}")
@@ -324,8 +378,7 @@ def list_conversation_flows(directory="conversation_flows"):
     
     for flow_path in flow_dir.glob("*.json"):
         try:
-            with open(flow_path, "r") as f:
-                data = json.load(f)
+            data = json_loads(flow_path.read_bytes())
             flows.append({
                 "flow_id": data.get("flow_id", ""),
                 "name": data.get("name", ""),
@@ -4,6 +4,14 @@ import json
 from pathlib import Path
 import streamlit as st
 import io
+import time
+import shutil
+
+# orjson is an optional speedup; fall back to the stdlib json module when it is missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 def setup_logging():
     """Set up logging configuration for the chatbot"""
@@ -21,6 +29,18 @@ def setup_logging():
     
     return logging.getLogger("chatbot")
 
+def json_loads(data):
+    """Parse JSON from a str or bytes object, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj, indent=True):
+    """Serialize an object to JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode("utf-8")
+
 def load_config():
     """Load configuration from config.json or return default config"""
     config_path = Path("config.json")
@@ -37,8 +57,8 @@ def load_config():
     
     if config_path.exists():
         try:
-            with open(config_path, "r") as f:
-                config = json.load(f)
+            with open(config_path, "rb") as f:
+                config = json_loads(f.read())
                 # Merge with default config to ensure all required fields exist
                 return {**default_config, **config}
         except Exception as e:
@@ -46,16 +66,94 @@ def load_config():
             return default_config
     else:
         # Create default config file
-        with open(config_path, "w") as f:
-            json.dump(default_config, f, indent=4)
+        with open(config_path, "wb") as f:
+            f.write(json_dumps(default_config))
         
         return default_config
 
+def file_mtime(path):
+    """Return the modification time of a file or directory, or None if it does not exist"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+# Config and the index are re-read only when their files change; clear these caches after writing the files
+@st.cache_data(show_spinner=False)
+def cached_config(mtime):
+    return load_config()
+
+@st.cache_resource(show_spinner=False)
+def load_index_cached(mtime):
+    # Import only if needed; index_functions imports this module
+    from index_functions import load_index
+    return load_index()
+
+def index_available(mtime):
+    """Load the index from disk if it changed since the last load and report whether one exists; mtime is None without an index"""
+    return mtime is not None and load_index_cached(mtime)
+
 def handle_user_input():
     """Get and process user input"""
     user_input = input("\nYou: ")
     return user_input
 
+# File types that can be read as plain text, and all file types that can be indexed
+TEXT_EXTENSIONS = frozenset({".txt", ".md", ".csv", ".json", ".py", ".js", ".html", ".css"})
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS | {".pdf"}
+
+def iter_files(directory, extensions=None):
+    """
+    Recursively yield os.DirEntry objects for the files under a directory without following symlinks
+    
+    If extensions is given, files whose lowercased extension is not in it are skipped before they are stat'ed.
+    """
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from iter_files(entry.path, extensions)
+                    continue
+                if extensions is not None:
+                    _, dot, ext = entry.name.rpartition(".")
+                    if not dot or "." + ext.lower() not in extensions:
+                        continue
+                if entry.is_file(follow_symlinks=False):
+                    yield entry
+    except PermissionError:
+        pass
+
+def clone_file(src, dst):
+    """
+    Copy a file as cheaply as the platform allows
+    
+    Tries os.copy_file_range (which reflinks on copy-on-write filesystems), then a
+    hardlink, then falls back to a regular shutil.copy2.
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                shutil.copystat(src, dst)
+                return
+        except OSError:
+            pass
+        Path(dst).unlink(missing_ok=True)
+    
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    
+    shutil.copy2(src, dst)
+
 def extract_text_from_file(file_path):
     """Extract text content from various file types"""
     file_path = Path(file_path)
@@ -65,7 +163,7 @@ def extract_text_from_file(file_path):
         return None
     
     # Text files
-    if file_path.suffix.lower() in ['.txt', '.md', '.csv', '.json', '.py', '.js', '.html', '.css']:
+    if file_path.suffix.lower() in TEXT_EXTENSIONS:
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 return f.read()
@@ -104,7 +202,7 @@ def extract_text_from_uploaded_file(uploaded_file):
     file_extension = Path(file_name).suffix.lower()
     
     # Text files
-    if file_extension in ['.txt', '.md', '.csv', '.json', '.py', '.js', '.html', '.css']:
+    if file_extension in TEXT_EXTENSIONS:
         try:
             # Decode the content as text
             text_content = uploaded_file.getvalue().decode('utf-8')
@@ -141,24 +239,194 @@ def extract_text_from_uploaded_file(uploaded_file):
 
 def save_chat_history(chat_history, filename="chat_history.json"):
     """Save chat history to a file"""
-    with open(filename, "w") as f:
+    with open(filename, "wb") as f:
         # Ensure chat history is in serializable format
         serializable_history = [
             {"role": msg["role"], "content": msg["content"]} 
             for msg in chat_history
         ]
-        json.dump(serializable_history, f, indent=4)
+        f.write(json_dumps(serializable_history))
 
 def load_chat_history(filename="chat_history.json"):
     """Load chat history from a file"""
     if not os.path.exists(filename):
         return []
     
-    with open(filename, "r") as f:
-        serialized_history = json.load(f)
+    with open(filename, "rb") as f:
+        serialized_history = json_loads(f.read())
         
     # Return as dictionaries with role and content
     return [
         {"role": msg["role"], "content": msg["content"]}
         for msg in serialized_history
-    ]
\ No newline at end of file
+    ]
+
+# Set once the conversations directory is known to exist; cleared when it turns out to have been deleted
+_conversations_dir_ready = False
+
+def ensure_conversations_dir():
+    """Create the conversations directory, only touching the filesystem until it is known to exist"""
+    global _conversations_dir_ready
+    if not _conversations_dir_ready:
+        os.makedirs("conversations", exist_ok=True)
+        _conversations_dir_ready = True
+
+def recreate_conversations_dir():
+    """Recreate the conversations directory after an operation found it deleted while the app runs"""
+    global _conversations_dir_ready
+    _conversations_dir_ready = False
+    ensure_conversations_dir()
+
+def conversations_dir_mtime():
+    """Return the conversations directory's st_mtime_ns, recreating the directory if it was deleted"""
+    try:
+        return os.stat("conversations").st_mtime_ns
+    except FileNotFoundError:
+        recreate_conversations_dir()
+        return os.stat("conversations").st_mtime_ns
+
+# Conversations are saved as JSON Lines (one message per line); .json files are legacy JSON arrays
+CONVERSATION_SUFFIXES = (".jsonl", ".json")
+
+def scan_conversations(directory="conversations"):
+    """Return (mtime, path) tuples for saved conversations, newest first, using a single directory scan"""
+    try:
+        with os.scandir(directory) as it:
+            entries = [
+                (entry.stat().st_mtime, entry.path)
+                for entry in it
+                if entry.name.endswith(CONVERSATION_SUFFIXES) and entry.is_file()
+            ]
+    except FileNotFoundError:
+        recreate_conversations_dir()
+        return []
+    entries.sort(reverse=True)
+    return entries
+
+def conversation_meta_path(path):
+    """Return the path of the metadata sidecar stored next to a saved conversation"""
+    return Path(path).with_suffix(".meta")
+
+def write_conversation_meta(path, n_messages, created=None):
+    """Write the metadata sidecar (message count and creation time) for a saved conversation"""
+    meta = {"n": n_messages, "created": created if created is not None else time.time()}
+    conversation_meta_path(path).write_bytes(json_dumps(meta, indent=False))
+
+def parse_conversation(data):
+    """Parse conversation bytes in either JSON Lines or legacy JSON array format"""
+    if data.lstrip()[:1] == b"[":
+        return json_loads(data)
+    return [json_loads(line) for line in data.splitlines() if line.strip()]
+
+def load_conversation(path):
+    """Load a saved conversation from disk"""
+    with open(path, "rb") as f:
+        return parse_conversation(f.read())
+
+def _write_all(fd, data):
+    """Write a whole buffer to a raw file descriptor, retrying on short writes"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _open_conversation_for_write(path):
+    """Open a conversation file for writing, recreating the conversations directory if it was deleted"""
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    try:
+        return os.open(path, flags, 0o644)
+    except FileNotFoundError:
+        recreate_conversations_dir()
+        return os.open(path, flags, 0o644)
+
+def save_conversation(messages, path):
+    """Save a conversation as a JSON Lines file along with its metadata sidecar"""
+    # Encode once and hand the whole buffer to a single unbuffered write
+    data = b"".join(json_dumps(msg, indent=False) + b"\n" for msg in messages)
+    fd = _open_conversation_for_write(path)
+    try:
+        _write_all(fd, data)
+    finally:
+        os.close(fd)
+    write_conversation_meta(path, len(messages))
+
+def iter_uploaded_conversation(uploaded_file):
+    """
+    Yield the messages of an uploaded conversation file, validating each one as it is parsed
+    
+    Both JSON Lines and JSON array files are accepted. Raises ValueError on the first
+    message that is not a dict with "role" and "content" keys.
+    """
+    if not bytes(uploaded_file.getbuffer()[:64]).lstrip().startswith(b"["):
+        messages = (json_loads(line) for line in uploaded_file.getvalue().splitlines() if line.strip())
+    else:
+        try:
+            import ijson
+        except ImportError:
+            messages = json_loads(uploaded_file.getvalue())
+            if not isinstance(messages, list):
+                raise ValueError("Conversation file must contain a list of messages")
+        else:
+            uploaded_file.seek(0)
+            messages = ijson.items(uploaded_file, "item", use_float=True)
+    
+    for msg in messages:
+        if not (isinstance(msg, dict) and "role" in msg and "content" in msg):
+            raise ValueError("Conversation messages must have a role and content")
+        yield msg
+
+def save_conversation_stream(messages, path, chunk_size=1000):
+    """Write an iterable of messages to a JSON Lines file in chunks and return the message count"""
+    n_messages = 0
+    chunk = []
+    fd = _open_conversation_for_write(path)
+    try:
+        try:
+            # One unbuffered write per chunk of encoded messages
+            for msg in messages:
+                chunk.append(json_dumps(msg, indent=False) + b"\n")
+                if len(chunk) >= chunk_size:
+                    _write_all(fd, b"".join(chunk))
+                    n_messages += len(chunk)
+                    chunk = []
+            if chunk:
+                _write_all(fd, b"".join(chunk))
+                n_messages += len(chunk)
+        finally:
+            os.close(fd)
+    except Exception:
+        # Don't leave a partial conversation behind
+        Path(path).unlink(missing_ok=True)
+        raise
+    
+    write_conversation_meta(path, n_messages)
+    return n_messages
+
+def count_conversation_messages(path):
+    """Return the number of messages in a saved conversation without parsing it when possible"""
+    try:
+        return json_loads(conversation_meta_path(path).read_bytes())["n"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    
+    # No usable sidecar: count the messages from the file itself
+    with open(path, "rb") as f:
+        if f.read(64).lstrip()[:1] != b"[":
+            # JSON Lines: one message per line, so counting newlines is enough
+            f.seek(0)
+            n_messages = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+        else:
+            # Legacy JSON array, streamed when ijson is installed
+            f.seek(0)
+            try:
+                import ijson
+                n_messages = sum(1 for _ in ijson.items(f, "item"))
+            except ImportError:
+                n_messages = len(json_loads(f.read()))
+    
+    # Backfill the sidecar so the next scan only reads the metadata
+    try:
+        write_conversation_meta(path, n_messages, created=os.path.getmtime(path))
+    except OSError as e:
+        logging.warning(f"Could not write conversation metadata for {path}: {e}")
+    
+    return n_messages
\ No newline at end of file
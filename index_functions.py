@@ -1,13 +1,11 @@
 import os
-import json
 import pickle
+import time
 from pathlib import Path
 import numpy as np
 from collections import defaultdict
 import streamlit as st
-from helper_functions import extract_text_from_file, load_config
-from mistralai import Mistral
-from document_processor import process_document, process_documents_batch, hierarchical_chunking
+from helper_functions import extract_text_from_file, load_config, json_dumps, iter_files, SUPPORTED_EXTENSIONS
 
 # Simple in-memory index for demonstration purposes
 index = {
@@ -20,14 +18,34 @@ index = {
     "initialized": False
 }
 
-def create_index(directory_path, logger, use_advanced_processing=True):
-    """Create an index of documents in the specified directory with advanced processing"""
+def embed_with_backoff(client, model, inputs, logger, max_retries=5):
+    """Request embeddings, retrying with exponential back-off when the API rate limits us"""
+    for attempt in range(max_retries):
+        try:
+            return client.embeddings.create(model=model, inputs=inputs)
+        except Exception as e:
+            rate_limited = getattr(e, "status_code", None) == 429 or "rate limit" in str(e).lower()
+            if not rate_limited or attempt == max_retries - 1:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"Rate limited while generating embeddings, retrying in {delay}s")
+            time.sleep(delay)
+
+def create_index(directory_path, logger, use_advanced_processing=True, files=None, append=False):
+    """
+    Create an index of documents in the specified directory with advanced processing
+    
+    If files is given, only those files are indexed. If append is True, the new
+    documents are added to the existing index instead of replacing it.
+    
+    Returns True if the index was written, False otherwise.
+    """
     directory = Path(directory_path)
     
-    if not directory.exists() or not directory.is_dir():
+    if files is None and (not directory.exists() or not directory.is_dir()):
         logger.error(f"Directory not found: {directory_path}")
         st.error(f"Error: Directory not found: {directory_path}")
-        return
+        return False
     
     logger.info(f"Creating index for directory: {directory_path}")
     
@@ -35,18 +53,22 @@ def create_index(directory_path, logger, use_advanced_processing=True):
     progress_text = st.empty()
     progress_bar = st.empty()
     
-    # Get all files recursively
-    files = list(directory.glob("**/*"))
-    files = [f for f in files if f.is_file()]
+    if files is None:
+        # Get all supported files recursively
+        files = [Path(entry.path) for entry in iter_files(directory, SUPPORTED_EXTENSIONS)]
+    else:
+        files = [Path(f) for f in files]
     
     if not files:
         logger.warning(f"No files found in directory: {directory_path}")
         st.warning("No files found in the specified directory.")
-        return
+        return False
     
     # Process documents with advanced processing if enabled
     if use_advanced_processing:
         progress_text.text("Processing documents with tokenizing and summarization...")
+        # Import only if needed
+        from document_processor import process_documents_batch
         processed_docs = process_documents_batch(files, display_progress=True)
         
         # Extract documents and metadata from processed docs
@@ -96,6 +118,8 @@ def create_index(directory_path, logger, use_advanced_processing=True):
         progress_text.text("Extracting text from files...")
         progress_bar.progress(0)
         
+        # Update the progress bar at most ~100 times
+        progress_step = max(1, len(files) // 100)
         for i, file_path in enumerate(files):
             try:
                 text = extract_text_from_file(file_path)
@@ -115,19 +139,21 @@ def create_index(directory_path, logger, use_advanced_processing=True):
                 logger.error(f"Error processing file {file_path}: {e}")
             
             # Update progress
-            progress_bar.progress((i + 1) / len(files))
+            if (i + 1) % progress_step == 0 or i == len(files) - 1:
+                progress_bar.progress((i + 1) / len(files))
     
     if not documents:
         logger.warning("No content extracted from files.")
         st.warning("No content could be extracted from the files.")
         progress_text.empty()
         progress_bar.empty()
-        return
+        return False
     
     # Generate embeddings for documents
     try:
         config = load_config()
         api_key = os.environ.get("MISTRAL_API_KEY", "")
+        from mistralai import Mistral
         client = Mistral(api_key=api_key)
         
         # Process documents in batches to avoid API limits
@@ -142,9 +168,11 @@ def create_index(directory_path, logger, use_advanced_processing=True):
             logger.info(f"Generating embeddings for batch {i//batch_size + 1}/{(len(documents)-1)//batch_size + 1}")
             
             # Use the client format for embeddings
-            response = client.embeddings.create(
-                model=config.get("embedding_model", "mistral-embed"),
-                inputs=batch
+            response = embed_with_backoff(
+                client,
+                config.get("embedding_model", "mistral-embed"),
+                batch,
+                logger
             )
             
             batch_embeddings = [item.embedding for item in response.data]
@@ -153,16 +181,32 @@ def create_index(directory_path, logger, use_advanced_processing=True):
             # Update progress
             progress_bar.progress(min(1.0, (i + batch_size) / len(documents)))
         
-        # Update index
-        index["documents"] = documents
-        index["embeddings"] = np.array(all_embeddings)
-        index["id_to_path"] = {i: path for i, path in enumerate(file_paths)}
-        index["id_to_metadata"] = {i: metadata.get(path, {}) for i, path in enumerate(file_paths)}
+        # Make sure the existing index is in memory before appending to it
+        if append and not index["initialized"]:
+            load_index()
         
-        # Add summaries and keywords if available
-        if use_advanced_processing:
-            index["summaries"] = summaries
-            index["keywords"] = all_keywords
+        if append and index["initialized"]:
+            # Add the new documents after the existing ones
+            offset = len(index["documents"])
+            index["documents"] = index["documents"] + documents
+            index["embeddings"] = np.vstack([index["embeddings"], np.array(all_embeddings)])
+            index["id_to_path"].update({offset + i: path for i, path in enumerate(file_paths)})
+            index["id_to_metadata"].update({offset + i: metadata.get(path, {}) for i, path in enumerate(file_paths)})
+            
+            if use_advanced_processing:
+                index.setdefault("summaries", {}).update(summaries)
+                index.setdefault("keywords", {}).update(all_keywords)
+        else:
+            # Update index
+            index["documents"] = documents
+            index["embeddings"] = np.array(all_embeddings)
+            index["id_to_path"] = {i: path for i, path in enumerate(file_paths)}
+            index["id_to_metadata"] = {i: metadata.get(path, {}) for i, path in enumerate(file_paths)}
+            
+            # Add summaries and keywords if available
+            if use_advanced_processing:
+                index["summaries"] = summaries
+                index["keywords"] = all_keywords
         
         index["initialized"] = True
         
@@ -172,12 +216,14 @@ def create_index(directory_path, logger, use_advanced_processing=True):
         logger.info(f"Index created successfully with {len(documents)} chunks from {len(set([metadata[p].get('path') for p in file_paths]))} files")
         progress_text.text(f"Index created successfully with {len(documents)} chunks from {len(set([metadata[p].get('path') for p in file_paths]))} files")
         progress_bar.progress(1.0)
+        return True
         
     except Exception as e:
         logger.error(f"Error creating index: {e}")
         st.error(f"Error creating index: {e}")
         progress_text.empty()
         progress_bar.empty()
+        return False
 
 def search_index(query, logger, top_k=3, include_metadata=True):
     """Search the index for documents relevant to the query"""
@@ -191,6 +237,7 @@ def search_index(query, logger, top_k=3, include_metadata=True):
         # Generate embedding for query
         config = load_config()
         api_key = os.environ.get("MISTRAL_API_KEY", "")
+        from mistralai import Mistral
         client = Mistral(api_key=api_key)
         
         # Use the client format for embeddings
@@ -297,8 +344,11 @@ def chunk_text(text, chunk_size=500, overlap=100):
 def save_index(index_data, filename="index.pkl"):
     """Save index to disk"""
     try:
-        with open(filename, "wb") as f:
+        # Write to a temporary file and swap it in, so backups that hardlink the index are never modified
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, "wb") as f:
             pickle.dump(index_data, f)
+        os.replace(tmp_filename, filename)
         
         # Also save a human-readable summary
         summary = {
@@ -315,8 +365,8 @@ def save_index(index_data, filename="index.pkl"):
             ]))
         }
         
-        with open("index_summary.json", "w") as f:
-            json.dump(summary, f, indent=4)
+        with open("index_summary.json", "wb") as f:
+            f.write(json_dumps(summary))
             
         return True
     except Exception as e:
@@ -4,13 +4,13 @@ from mistralai import Mistral
 import time
 from pathlib import Path
 import sys
-import json
 
 # Add the parent directory to the path so we can import the helper modules
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
-from helper_functions import setup_logging, load_config
+from helper_functions import setup_logging, load_config, ensure_conversations_dir, save_conversation
 from index_functions import search_index, load_index
 
 # Check for response grading module
@@ -120,10 +120,11 @@ with st.sidebar:
         
         # Flow selection for active conversations
         flow_options = [flow["flow_id"] for flow in conversation_flows]
+        flow_name_by_id = {flow["flow_id"]: flow["name"] for flow in conversation_flows}
         default_flow = st.selectbox(
             "Default conversation flow", 
             options=["None"] + flow_options,
-            format_func=lambda x: next((flow["name"] for flow in conversation_flows if flow["flow_id"] == x), x) if x != "None" else "None",
+            format_func=lambda x: flow_name_by_id.get(x, x),
             help="Default flow to use when no specific flow is specified"
         )
     else:
@@ -161,7 +162,7 @@ with st.sidebar:
             del st.session_state.active_flow
         if "flow_state" in st.session_state:
             del st.session_state.flow_state
-        st.experimental_rerun()
+        st.rerun()
     
     # Conversation management
     st.markdown("---")
@@ -171,12 +172,12 @@ with st.sidebar:
     if st.button("Save Current Conversation"):
         if "messages" in st.session_state and len(st.session_state.messages) > 0:
             # Create conversations directory if it doesn't exist
-            os.makedirs("conversations", exist_ok=True)
+            ensure_conversations_dir()
             
             # Generate filename based on timestamp
             import datetime
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"conversations/conversation_{timestamp}.json"
+            filename = f"conversations/conversation_{timestamp}.jsonl"
             
             # Save conversation - ensure we only save the role and content
             clean_messages = []
@@ -188,8 +189,7 @@ with st.sidebar:
                 }
                 clean_messages.append(clean_msg)
                 
-            with open(filename, "w") as f:
-                json.dump(clean_messages, f, indent=2)
+            save_conversation(clean_messages, filename)
             
             st.success(f"Conversation saved as {filename}")
         else:
@@ -443,7 +443,7 @@ if prompt:
             with st.chat_message("assistant"):
                 st.markdown(flow_result)
             st.session_state.messages.append({"role": "assistant", "content": flow_result})
-            st.experimental_rerun()
+            st.rerun()
     
     # Check for grading request
     elif has_grader and enable_grading and prompt.lower().startswith("/grade"):
@@ -611,7 +611,7 @@ if prompt:
                     st.session_state.messages.append({"role": "assistant", "content": new_stage.user_prompt})
                 
                 # Rerun to update the UI
-                st.experimental_rerun()
+                st.rerun()
 
 # Add helpful information
 with st.expander("Tips & Commands"):
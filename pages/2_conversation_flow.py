@@ -7,7 +7,8 @@ import time
 
 # Add the parent directory to the path so we can import the helper modules
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
 # Check if the conversation_flow module is available
 try:
@@ -18,14 +19,15 @@ try:
         save_conversation_flow,
         load_conversation_flow,
         list_conversation_flows,
-        create_default_flows
+        create_default_flows,
+        validate_flow_data
     )
     has_flow_module = True
 except ImportError:
     has_flow_module = False
     st.error("Conversation flow module not found. Make sure conversation_flow.py is in the main directory.")
 
-from helper_functions import setup_logging, load_config
+from helper_functions import setup_logging, load_config, json_loads, json_dumps
 
 # Setup
 logger = setup_logging()
@@ -42,12 +44,90 @@ st.set_page_config(
 @st.cache_resource
 def initialize_flows():
     flows_dir = Path("conversation_flows")
-    if not flows_dir.exists():
-        flows_dir.mkdir(exist_ok=True)
-        if has_flow_module:
-            return create_default_flows()
+    flows_dir.mkdir(exist_ok=True)
+    # Only write the default flows when the directory holds no flows yet
+    if has_flow_module and not any(flows_dir.glob("*.json")):
+        return create_default_flows()
     return []
 
+# Cache deserialized flows; the file mtime is part of the key so a saved flow is reloaded,
+# and the entry cap evicts the versions left behind by earlier saves
+FLOW_CACHE_MAX_ENTRIES = 32
+
+@st.cache_resource(max_entries=FLOW_CACHE_MAX_ENTRIES)
+def _load_flow_cached(flow_id, mtime_ns):
+    return load_conversation_flow(flow_id)
+
+def load_flow(flow_id):
+    """Load a read-only conversation flow through the resource cache"""
+    try:
+        mtime_ns = os.stat(Path("conversation_flows") / f"{flow_id}.json").st_mtime_ns
+    except OSError:
+        return load_conversation_flow(flow_id)
+    return _load_flow_cached(flow_id, mtime_ns)
+
+# Cache the encoded export, keyed on the flow file's mtime like the loader above
+@st.cache_data(max_entries=FLOW_CACHE_MAX_ENTRIES)
+def _export_bytes(flow_id, mtime_ns):
+    flow = load_conversation_flow(flow_id)
+    return json_dumps(flow.to_dict()) if flow else None
+
+def export_flow_bytes(flow_id):
+    """Return the JSON export of a flow as bytes, or None if it cannot be loaded"""
+    try:
+        mtime_ns = os.stat(Path("conversation_flows") / f"{flow_id}.json").st_mtime_ns
+    except OSError:
+        return None
+    return _export_bytes(flow_id, mtime_ns)
+
+# Test conversations longer than the watermark have all but their tail checkpointed to disk
+TEST_MESSAGES_WATERMARK = 200
+TEST_MESSAGES_TAIL = 50
+CHECKPOINT_DIR = Path("checkpoints")
+CHECKPOINT_PREFIX = "[checkpoint:"
+
+def is_checkpoint_marker(message):
+    return message["role"] == "system" and message["content"].startswith(CHECKPOINT_PREFIX)
+
+def checkpoint_path(message):
+    return message["content"][len(CHECKPOINT_PREFIX):-1]
+
+def checkpoint_test_messages(flow_id):
+    """Move older test messages to a checkpoint file once the session holds too many"""
+    messages = st.session_state.test_messages
+    if len(messages) <= TEST_MESSAGES_WATERMARK:
+        return
+    
+    head, tail = messages[:-TEST_MESSAGES_TAIL], messages[-TEST_MESSAGES_TAIL:]
+    CHECKPOINT_DIR.mkdir(exist_ok=True)
+    path = CHECKPOINT_DIR / f"_test_{flow_id}_{time.time_ns()}.ckpt.json"
+    path.write_bytes(json_dumps(head, indent=False))
+    st.session_state.test_messages = [{"role": "system", "content": f"{CHECKPOINT_PREFIX}{path}]"}] + tail
+
+@st.cache_data
+def load_test_checkpoint(path):
+    return json_loads(Path(path).read_bytes())
+
+def render_test_messages(messages):
+    """Display test messages, loading checkpointed history only when asked for"""
+    for message in messages:
+        if is_checkpoint_marker(message):
+            path = checkpoint_path(message)
+            if st.checkbox("Show earlier messages", key=f"show_{path}"):
+                render_test_messages(load_test_checkpoint(path))
+            continue
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+def discard_test_checkpoints(messages):
+    """Delete the checkpoint files referenced by a test conversation"""
+    for message in messages:
+        if is_checkpoint_marker(message):
+            path = Path(checkpoint_path(message))
+            if path.exists():
+                discard_test_checkpoints(json_loads(path.read_bytes()))
+                path.unlink()
+
 # Check if the flow module is available
 if not has_flow_module:
     st.error("The Conversation Flows feature requires the conversation_flow.py module. Make sure it exists in your main directory.")
@@ -58,6 +138,8 @@ initialize_flows()
 
 # List available flows
 flows = list_conversation_flows()
+flow_ids = [flow["flow_id"] for flow in flows]
+flow_name_by_id = {flow["flow_id"]: flow["name"] for flow in flows}
 
 # Sidebar
 with st.sidebar:
@@ -77,7 +159,7 @@ with st.sidebar:
         with st.spinner("Creating default flows..."):
             created_flows = create_default_flows()
             st.success(f"Created {len(created_flows)} default flows!")
-            st.experimental_rerun()
+            st.rerun()
     
     # Link back to chat
     st.markdown("---")
@@ -98,13 +180,13 @@ with tabs[0]:
     if flows:
         selected_flow_id = st.selectbox(
             "Select a flow to view",
-            options=[flow["flow_id"] for flow in flows],
-            format_func=lambda x: next((flow["name"] for flow in flows if flow["flow_id"] == x), x)
+            options=flow_ids,
+            format_func=lambda x: flow_name_by_id.get(x, x)
         )
         
         # Load the selected flow
         if selected_flow_id:
-            flow = load_conversation_flow(selected_flow_id)
+            flow = load_flow(selected_flow_id)
             
             if flow:
                 # Display flow details
@@ -142,33 +224,41 @@ with tabs[0]:
                 st.graphviz_chart(graph)
                 
                 # Display detailed stage information
-                for stage_id, stage in flow.stages.items():
-                    with st.expander(f"Stage: {stage.name} (`{stage_id}`)"):
-                        st.markdown(f"**Max Turns:** {stage.max_turns}")
-                        
-                        # Next stages
-                        st.markdown("**Next Stages:**")
-                        if stage.next_stages:
-                            for next_stage_id in stage.next_stages:
-                                next_stage_name = flow.stages.get(next_stage_id, ConversationStage(next_stage_id, next_stage_id, "")).name
-                                st.markdown(f"- `{next_stage_id}` ({next_stage_name})")
-                        else:
-                            st.markdown("- *Terminal stage (no next stages)*")
-                        
-                        # Completion criteria
-                        if stage.completion_criteria:
-                            st.markdown("**Completion Criteria:**")
-                            for criterion, description in stage.completion_criteria.items():
-                                st.markdown(f"- **{criterion}:** {description}")
-                        
-                        # System prompt
-                        st.markdown("**System Prompt:**")
-                        st.text_area("", stage.system_prompt, height=150, key=f"view_prompt_{stage_id}", disabled=True)
-                        
-                        # User prompt if available
-                        if stage.user_prompt:
-                            st.markdown("**User Prompt:**")
-                            st.text_area("", stage.user_prompt, height=100, key=f"view_user_prompt_{stage_id}", disabled=True)
+                with st.container():
+                    for stage_id, stage in flow.stages.items():
+                        with st.expander(f"Stage: {stage.name} (`{stage_id}`)"):
+                            # Cheap header, always rendered
+                            next_stages_text = ", ".join(f"`{s}`" for s in stage.next_stages) or "*Terminal stage (no next stages)*"
+                            st.markdown(f"**Max Turns:** {stage.max_turns} | **Next Stages:** {next_stages_text}")
+                            
+                            # Expander bodies are executed even when collapsed, so only
+                            # materialize the prompts and criteria when asked for
+                            if not st.checkbox("Show details", key=f"exp_open_{stage_id}"):
+                                continue
+                            
+                            # Next stages
+                            st.markdown("**Next Stages:**")
+                            if stage.next_stages:
+                                for next_stage_id in stage.next_stages:
+                                    next_stage_name = flow.stages.get(next_stage_id, ConversationStage(next_stage_id, next_stage_id, "")).name
+                                    st.markdown(f"- `{next_stage_id}` ({next_stage_name})")
+                            else:
+                                st.markdown("- *Terminal stage (no next stages)*")
+                            
+                            # Completion criteria
+                            if stage.completion_criteria:
+                                st.markdown("**Completion Criteria:**")
+                                for criterion, description in stage.completion_criteria.items():
+                                    st.markdown(f"- **{criterion}:** {description}")
+                            
+                            # System prompt
+                            st.markdown("**System Prompt:**")
+                            st.text_area("", stage.system_prompt, height=150, key=f"view_prompt_{stage_id}", disabled=True)
+                            
+                            # User prompt if available
+                            if stage.user_prompt:
+                                st.markdown("**User Prompt:**")
+                                st.text_area("", stage.user_prompt, height=100, key=f"view_user_prompt_{stage_id}", disabled=True)
                 
                 # Delete flow button
                 if st.button("Delete Flow", key=f"delete_{flow.flow_id}"):
@@ -177,9 +267,8 @@ with tabs[0]:
                         if flow_path.exists():
                             try:
                                 os.remove(flow_path)
-                                st.success(f"Flow '{flow.name}' deleted successfully!")
-                                time.sleep(1)
-                                st.experimental_rerun()
+                                st.toast(f"Flow '{flow.name}' deleted successfully!", icon="✅")
+                                st.rerun()
                             except Exception as e:
                                 st.error(f"Error deleting flow: {str(e)}")
             else:
@@ -198,8 +287,8 @@ with tabs[1]:
         # Select flow to edit
         edit_flow_id = st.selectbox(
             "Select a flow to edit",
-            options=[flow["flow_id"] for flow in flows],
-            format_func=lambda x: next((flow["name"] for flow in flows if flow["flow_id"] == x), x),
+            options=flow_ids,
+            format_func=lambda x: flow_name_by_id.get(x, x),
             key="edit_flow_select"
         )
         
@@ -228,18 +317,40 @@ with tabs[1]:
                     index=existing_stages.index(flow.initial_stage) if flow.initial_stage in existing_stages else 0
                 )
                 
+                # Build widget keys once per stage instead of formatting them inside the render loop
+                widget_keys = {
+                    sid: {
+                        "name": f"edit_name_{sid}",
+                        "next": f"edit_next_{sid}",
+                        "turns": f"edit_turns_{sid}",
+                        "prompt": f"edit_prompt_{sid}",
+                        "user_prompt": f"edit_user_prompt_{sid}",
+                        "crit_key": [f"edit_crit_key_{sid}_{i}" for i in range(len(s.completion_criteria))],
+                        "crit_value": [f"edit_crit_value_{sid}_{i}" for i in range(len(s.completion_criteria))],
+                        "crit_remove": [f"edit_crit_remove_{sid}_{i}" for i in range(len(s.completion_criteria))],
+                        "new_crit_key": f"new_crit_key_{sid}",
+                        "new_crit_value": f"new_crit_value_{sid}",
+                        "update": f"update_{sid}",
+                        "delete": f"delete_stage_{sid}",
+                        "confirm_delete": f"confirm_stage_delete_{sid}",
+                        "label": f"Stage: {s.name} (`{sid}`)"
+                    }
+                    for sid, s in flow.stages.items()
+                }
+                
                 # Display existing stages
                 for stage_id, stage in flow.stages.items():
-                    with st.expander(f"Stage: {stage.name} (`{stage_id}`)"):
+                    keys = widget_keys[stage_id]
+                    with st.expander(keys["label"]):
                         # Stage details
-                        stage_name = st.text_input("Stage Name", value=stage.name, key=f"edit_name_{stage_id}")
+                        stage_name = st.text_input("Stage Name", value=stage.name, key=keys["name"])
                         
                         # Next stages (multiselect)
                         next_stages = st.multiselect(
                             "Next Stages",
                             options=[s for s in existing_stages if s != stage_id],
                             default=stage.next_stages,
-                            key=f"edit_next_{stage_id}"
+                            key=keys["next"]
                         )
                         
                         # Max turns
@@ -248,7 +359,7 @@ with tabs[1]:
                             min_value=1,
                             max_value=10,
                             value=stage.max_turns,
-                            key=f"edit_turns_{stage_id}"
+                            key=keys["turns"]
                         )
                         
                         # System prompt
@@ -256,7 +367,7 @@ with tabs[1]:
                             "System Prompt",
                             value=stage.system_prompt,
                             height=150,
-                            key=f"edit_prompt_{stage_id}"
+                            key=keys["prompt"]
                         )
                         
                         # User prompt
@@ -264,7 +375,7 @@ with tabs[1]:
                             "User Prompt (Optional)",
                             value=stage.user_prompt or "",
                             height=100,
-                            key=f"edit_user_prompt_{stage_id}"
+                            key=keys["user_prompt"]
                         )
                         
                         # Completion criteria
@@ -277,13 +388,13 @@ with tabs[1]:
                         for i, (key, value) in enumerate(existing_criteria):
                             col1, col2, col3 = st.columns([3, 6, 1])
                             with col1:
-                                new_key = st.text_input("Criterion", value=key, key=f"edit_crit_key_{stage_id}_{i}")
+                                new_key = st.text_input("Criterion", value=key, key=keys["crit_key"][i])
                             with col2:
-                                new_value = st.text_input("Description", value=value, key=f"edit_crit_value_{stage_id}_{i}")
+                                new_value = st.text_input("Description", value=value, key=keys["crit_value"][i])
                             with col3:
                                 st.write("")
                                 st.write("")
-                                remove = st.checkbox("Remove", key=f"edit_crit_remove_{stage_id}_{i}")
+                                remove = st.checkbox("Remove", key=keys["crit_remove"][i])
                             
                             if not remove and new_key:
                                 criteria[new_key] = new_value
@@ -292,9 +403,9 @@ with tabs[1]:
                         st.markdown("**Add New Criterion**")
                         new_crit_col1, new_crit_col2 = st.columns([3, 6])
                         with new_crit_col1:
-                            new_crit_key = st.text_input("Criterion", key=f"new_crit_key_{stage_id}")
+                            new_crit_key = st.text_input("Criterion", key=keys["new_crit_key"])
                         with new_crit_col2:
-                            new_crit_value = st.text_input("Description", key=f"new_crit_value_{stage_id}")
+                            new_crit_value = st.text_input("Description", key=keys["new_crit_value"])
                         
                         if new_crit_key:
                             criteria[new_crit_key] = new_crit_value
@@ -302,7 +413,7 @@ with tabs[1]:
                         # Update or delete stage
                         col1, col2 = st.columns(2)
                         with col1:
-                            if st.button("Update Stage", key=f"update_{stage_id}"):
+                            if st.button("Update Stage", key=keys["update"]):
                                 # Create updated stage
                                 updated_stage = ConversationStage(
                                     stage_id=stage_id,
@@ -329,8 +440,8 @@ with tabs[1]:
                                     st.error("Error updating stage")
                         
                         with col2:
-                            if st.button("Delete Stage", key=f"delete_stage_{stage_id}"):
-                                if st.checkbox("Confirm deletion", key=f"confirm_stage_delete_{stage_id}"):
+                            if st.button("Delete Stage", key=keys["delete"]):
+                                if st.checkbox("Confirm deletion", key=keys["confirm_delete"]):
                                     # Remove stage from flow
                                     if stage_id in flow.stages:
                                         del flow.stages[stage_id]
@@ -347,7 +458,7 @@ with tabs[1]:
                                         # Save flow
                                         if save_conversation_flow(flow):
                                             st.success(f"Stage '{stage_name}' deleted successfully!")
-                                            st.experimental_rerun()
+                                            st.rerun()
                                         else:
                                             st.error("Error deleting stage")
                 
@@ -396,7 +507,7 @@ with tabs[1]:
                                 # Save flow
                                 if save_conversation_flow(flow):
                                     st.success(f"Stage '{new_stage_name}' added successfully!")
-                                    st.experimental_rerun()
+                                    st.rerun()
                                 else:
                                     st.error("Error adding stage")
                         else:
@@ -428,7 +539,7 @@ with tabs[1]:
         if st.button("Create Flow", key="create_flow"):
             if new_flow_id and new_flow_name:
                 # Check if flow ID already exists
-                existing_flow_ids = [flow["flow_id"] for flow in flows]
+                existing_flow_ids = {flow["flow_id"] for flow in flows}
                 if new_flow_id in existing_flow_ids:
                     st.error(f"Flow ID '{new_flow_id}' already exists")
                 else:
@@ -443,10 +554,8 @@ with tabs[1]:
                     
                     # Save flow
                     if save_conversation_flow(new_flow):
-                        st.success(f"Flow '{new_flow_name}' created successfully!")
-                        st.info("Now add stages to your flow using the Edit Existing Flow option.")
-                        time.sleep(1)
-                        st.experimental_rerun()
+                        st.toast(f"Flow '{new_flow_name}' created successfully! Now add stages to it using the Edit Existing Flow option.", icon="✅")
+                        st.rerun()
                     else:
                         st.error("Error creating flow")
             else:
@@ -460,14 +569,14 @@ with tabs[2]:
     if flows:
         test_flow_id = st.selectbox(
             "Select a flow to test",
-            options=[flow["flow_id"] for flow in flows],
-            format_func=lambda x: next((flow["name"] for flow in flows if flow["flow_id"] == x), x),
+            options=flow_ids,
+            format_func=lambda x: flow_name_by_id.get(x, x),
             key="test_flow_select"
         )
         
         # Load the selected flow
         if test_flow_id:
-            flow = load_conversation_flow(test_flow_id)
+            flow = load_flow(test_flow_id)
             
             if flow:
                 # Initialize or retrieve conversation state
@@ -489,8 +598,9 @@ with tabs[2]:
                         stage_turns={flow.initial_stage: 0},
                         data={}
                     )
+                    discard_test_checkpoints(st.session_state.get("test_messages", []))
                     st.session_state.test_messages = []
-                    st.experimental_rerun()
+                    st.rerun()
                 
                 # Initialize messages if needed
                 if "test_messages" not in st.session_state:
@@ -531,9 +641,7 @@ with tabs[2]:
                     # Display conversation
                     st.markdown("### Conversation")
                     
-                    for message in st.session_state.test_messages:
-                        with st.chat_message(message["role"]):
-                            st.markdown(message["content"])
+                    render_test_messages(st.session_state.test_messages)
                     
                     # If there are no messages yet, display the initial system message
                     if not st.session_state.test_messages:
@@ -591,9 +699,10 @@ with tabs[2]:
                                 # Create messages for the API call
                                 messages = [{"role": "system", "content": system_message}]
                                 
-                                # Add conversation history
+                                # Add conversation history (checkpointed history is not sent)
                                 for msg in st.session_state.test_messages:
-                                    messages.append({"role": msg["role"], "content": msg["content"]})
+                                    if not is_checkpoint_marker(msg):
+                                        messages.append({"role": msg["role"], "content": msg["content"]})
                                 
                                 # Get response from Mistral
                                 response = client.chat.complete(
@@ -608,47 +717,38 @@ with tabs[2]:
                                 # Check if stage changed
                                 old_stage_id = current_stage_id
                                 new_stage_id = st.session_state.conversation_state.current_stage_id
+                                new_stage = flow.stages.get(new_stage_id) if old_stage_id != new_stage_id else None
                                 
-                                if old_stage_id != new_stage_id:
-                                    # Stage changed, add a system message
-                                    new_stage = flow.stages.get(new_stage_id)
-                                    if new_stage:
-                                        transition_message = f"*[System: Moving from {current_stage.name} to {new_stage.name} stage]*"
-                                        
-                                        with st.chat_message("system"):
-                                            st.markdown(transition_message)
-                                        
-                                        # Add to messages
-                                        st.session_state.test_messages.append({
-                                            "role": "system", 
-                                            "content": transition_message
-                                        })
+                                # Collect the new messages locally; the rerun below draws them
+                                new_messages = []
                                 
-                                # Display assistant response
-                                with st.chat_message("assistant"):
-                                    st.markdown(assistant_message)
+                                if new_stage:
+                                    # Stage changed, add a system message
+                                    transition_message = f"*[System: Moving from {current_stage.name} to {new_stage.name} stage]*"
+                                    new_messages.append({
+                                        "role": "system", 
+                                        "content": transition_message
+                                    })
                                 
-                                # Add to messages
-                                st.session_state.test_messages.append({
+                                # Assistant response
+                                new_messages.append({
                                     "role": "assistant", 
                                     "content": assistant_message
                                 })
                                 
-                                # If new stage has a user prompt, display it
-                                if old_stage_id != new_stage_id:
-                                    new_stage = flow.stages.get(new_stage_id)
-                                    if new_stage and new_stage.user_prompt:
-                                        with st.chat_message("assistant"):
-                                            st.markdown(new_stage.user_prompt)
-                                        
-                                        # Add to messages
-                                        st.session_state.test_messages.append({
-                                            "role": "assistant", 
-                                            "content": new_stage.user_prompt
-                                        })
+                                # If new stage has a user prompt, add it
+                                if new_stage and new_stage.user_prompt:
+                                    new_messages.append({
+                                        "role": "assistant", 
+                                        "content": new_stage.user_prompt
+                                    })
+                                
+                                # Add to messages in one update
+                                st.session_state.test_messages.extend(new_messages)
+                                checkpoint_test_messages(flow.flow_id)
                                 
                                 # Rerun to update the UI
-                                st.experimental_rerun()
+                                st.rerun()
                                 
                             except Exception as e:
                                 st.error(f"Error generating response: {str(e)}")
@@ -671,23 +771,26 @@ with tabs[3]:
     if flows:
         export_flow_id = st.selectbox(
             "Select a flow to export",
-            options=[flow["flow_id"] for flow in flows],
-            format_func=lambda x: next((flow["name"] for flow in flows if flow["flow_id"] == x), x),
+            options=flow_ids,
+            format_func=lambda x: flow_name_by_id.get(x, x),
             key="export_flow_select"
         )
         
-        if export_flow_id:
-            flow = load_conversation_flow(export_flow_id)
+        # Only encode the flow once an export has been requested for it
+        st.button(
+            "Prepare Export",
+            on_click=lambda: st.session_state.__setitem__("_want_flow_export", export_flow_id)
+        )
+        
+        if export_flow_id and st.session_state.get("_want_flow_export") == export_flow_id:
+            flow_json = export_flow_bytes(export_flow_id)
             
-            if flow:
-                # Convert flow to JSON
-                flow_json = json.dumps(flow.to_dict(), indent=2)
-                
+            if flow_json:
                 # Provide download button
                 st.download_button(
                     label="Download Flow as JSON",
                     data=flow_json,
-                    file_name=f"{flow.flow_id}.json",
+                    file_name=f"{export_flow_id}.json",
                     mime="application/json"
                 )
     else:
@@ -702,15 +805,20 @@ with tabs[3]:
     if uploaded_file:
         try:
             # Load the JSON data
-            flow_data = json.load(uploaded_file)
+            flow_data = json_loads(uploaded_file.getvalue())
+            
+            # Validate the structure before building a flow from it
+            validate_flow_data(flow_data)
             
-            # Preview flow data
-            st.json(flow_data)
+            # Preview flow data only on request; st.json sends the whole tree to the browser
+            with st.expander("Preview uploaded flow", expanded=False):
+                if st.checkbox("Show preview", key="preview_uploaded_flow"):
+                    st.json(flow_data)
             
             # Import button
             if st.button("Import Flow"):
                 # Check if flow ID already exists
-                existing_flow_ids = [flow["flow_id"] for flow in flows]
+                existing_flow_ids = {flow["flow_id"] for flow in flows}
                 flow_id = flow_data.get("flow_id", "")
                 
                 if flow_id in existing_flow_ids:
@@ -721,9 +829,10 @@ with tabs[3]:
                         
                         # Save flow
                         if save_conversation_flow(flow):
-                            st.success(f"Flow '{flow.name}' imported successfully!")
-                            time.sleep(1)
-                            st.experimental_rerun()
+                            _load_flow_cached.clear()
+                            _export_bytes.clear()
+                            st.toast(f"Flow '{flow.name}' imported successfully!", icon="✅")
+                            st.rerun()
                         else:
                             st.error("Error importing flow")
                 else:
@@ -732,13 +841,16 @@ with tabs[3]:
                     
                     # Save flow
                     if save_conversation_flow(flow):
-                        st.success(f"Flow '{flow.name}' imported successfully!")
-                        time.sleep(1)
-                        st.experimental_rerun()
+                        _load_flow_cached.clear()
+                        _export_bytes.clear()
+                        st.toast(f"Flow '{flow.name}' imported successfully!", icon="✅")
+                        st.rerun()
                     else:
                         st.error("Error importing flow")
         except json.JSONDecodeError:
             st.error("Invalid JSON file")
+        except ValueError as e:
+            st.error(f"Invalid flow file: {str(e)}")
         except Exception as e:
             st.error(f"Error importing flow: {str(e)}")
 
@@ -1,13 +1,26 @@
 import os
 import streamlit as st
-import json
 from pathlib import Path
 import sys
 import datetime
+from collections import Counter
+from operator import itemgetter
 
 # Add the parent directory to the path so we can import the helper modules
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from helper_functions import (
+    load_conversation,
+    save_conversation_stream,
+    iter_uploaded_conversation,
+    ensure_conversations_dir,
+    conversations_dir_mtime,
+    scan_conversations,
+    count_conversation_messages,
+    conversation_meta_path
+)
 
 # Page configuration
 st.set_page_config(
@@ -42,13 +55,97 @@ with st.sidebar:
 st.title("Saved Conversations")
 
 # Create conversations directory if it doesn't exist
-os.makedirs("conversations", exist_ok=True)
+ensure_conversations_dir()
+
+@st.cache_data(ttl=30)
+def list_conversations(dir_mtime_ns):
+    """
+    Scan the conversations directory and return (label, path, message count) tuples, newest first
+    
+    dir_mtime_ns is only part of the cache key, so the scan is redone whenever a file is added or removed.
+    """
+    entries = []
+    for timestamp, path in scan_conversations():
+        try:
+            # Get message count from the metadata sidecar
+            n_messages = count_conversation_messages(path)
+            
+            entries.append((timestamp, path, n_messages))
+        except Exception:
+            # Skip invalid files
+            continue
+    
+    return [
+        (f"{datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')} ({n_messages} messages)", path, n_messages)
+        for timestamp, path, n_messages in entries
+    ]
+
+# Conversations longer than this are rendered as a single markdown block instead of chat widgets
+LARGE_CONVERSATION_THRESHOLD = 50
+
+@st.cache_data(max_entries=16)
+def load_conversation_view(path, mtime_ns):
+    """
+    Parse a saved conversation once per file version and return what the page displays
+    
+    Large conversations come back as message counts plus one markdown string, without the messages
+    themselves. mtime_ns is only part of the cache key.
+    """
+    messages = load_conversation(path)
+    role_counts = Counter(map(itemgetter("role"), messages))
+    view = {
+        "total": len(messages),
+        "user": role_counts["user"],
+        "assistant": role_counts["assistant"],
+        "markdown": None,
+        "messages": messages
+    }
+    if len(messages) > LARGE_CONVERSATION_THRESHOLD:
+        view["markdown"] = "\n\n".join(f"**{message['role']}:**\n\n{message['content']}\n\n---" for message in messages)
+        view["messages"] = None
+    return view
+
+@st.fragment
+def render_conversation(path):
+    """Display a saved conversation; as a fragment it only reruns for its own widgets"""
+    try:
+        view = load_conversation_view(path, os.stat(path).st_mtime_ns)
+        
+        # Create a chat-like display
+        st.subheader("Conversation")
+        
+        # Display stats
+        stats_col1, stats_col2, stats_col3 = st.columns(3)
+        with stats_col1:
+            st.metric("Total Messages", view["total"])
+        with stats_col2:
+            st.metric("User Messages", view["user"])
+        with stats_col3:
+            st.metric("Assistant Messages", view["assistant"])
+        
+        # Display messages; large conversations are drawn as one markdown block
+        with st.container():
+            if view["markdown"] is not None:
+                st.markdown(view["markdown"])
+            else:
+                for message in view["messages"]:
+                    with st.chat_message(message["role"]):
+                        st.markdown(message["content"])
+        
+        # Option to continue this conversation
+        if st.button("Continue this conversation in Chat"):
+            # Store the conversation in session state to be loaded in the Chat page
+            st.session_state.messages = view["messages"] or load_conversation(path)
+            # Redirect to Chat page
+            st.switch_page("pages/1_chat.py")
+            
+    except Exception as e:
+        st.error(f"Error loading conversation: {str(e)}")
 
 # Get list of saved conversations
-conversation_files = list(Path("conversations").glob("*.json"))
-conversation_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+conversation_options = list_conversations(conversations_dir_mtime())
 
-if not conversation_files:
+if not conversation_options:
     st.info("No saved conversations found. You can save conversations from the Chat page.")
 else:
     # Display list of conversations
@@ -60,54 +157,38 @@ else:
         col1, col2 = st.columns([1, 3])
         
         with col1:
-            # Create select box with conversation dates
-            conversation_options = []
-            for file in conversation_files:
-                try:
-                    # Get creation time
-                    timestamp = file.stat().st_mtime
-                    date_str = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # Get message count
-                    with open(file, "r") as f:
-                        messages = json.load(f)
-                    
-                    # Create option label
-                    label = f"{date_str} ({len(messages)} messages)"
-                    conversation_options.append((label, file))
-                except:
-                    # Skip invalid files
-                    continue
-            
             if conversation_options:
                 # Extract just the labels for the selectbox
-                labels = [label for label, _ in conversation_options]
+                labels = [label for label, _, _ in conversation_options]
                 selected_label = st.selectbox("Select conversation", labels)
                 
                 # Find the selected file
-                selected_file = next((file for label, file in conversation_options if label == selected_label), None)
+                selected_file = next((Path(path) for label, path, _ in conversation_options if label == selected_label), None)
                 
                 # Delete button
                 if st.button("Delete Selected Conversation"):
                     try:
                         os.remove(selected_file)
+                        conversation_meta_path(selected_file).unlink(missing_ok=True)
+                        list_conversations.clear()
                         st.success("Conversation deleted successfully.")
-                        st.experimental_rerun()
+                        st.rerun()
                     except Exception as e:
                         st.error(f"Error deleting conversation: {str(e)}")
                 
-                # Export button
-                if st.button("Export Selected Conversation"):
+                # Export button; the file is only read once an export has been requested for it
+                st.button(
+                    "Export Selected Conversation",
+                    on_click=lambda: st.session_state.__setitem__("_want_export", str(selected_file))
+                )
+                if st.session_state.get("_want_export") == str(selected_file):
                     try:
-                        with open(selected_file, "r") as f:
-                            conversation_data = f.read()
-                        
-                        # Create download button
+                        # Create download button with the raw file bytes
                         st.download_button(
                             label="Download Conversation",
-                            data=conversation_data,
-                            file_name=f"conversation_{selected_label.split(' ')[0]}.json",
-                            mime="application/json"
+                            data=selected_file.read_bytes(),
+                            file_name=f"conversation_{selected_label.split(' ')[0]}{selected_file.suffix}",
+                            mime="application/x-ndjson" if selected_file.suffix == ".jsonl" else "application/json"
                         )
                     except Exception as e:
                         st.error(f"Error exporting conversation: {str(e)}")
@@ -117,67 +198,28 @@ else:
         # Display the selected conversation
         with col2:
             if conversation_options:
-                try:
-                    with open(selected_file, "r") as f:
-                        messages = json.load(f)
-                    
-                    # Create a chat-like display
-                    st.subheader("Conversation")
-                    
-                    # Add summary info
-                    user_messages = sum(1 for msg in messages if msg["role"] == "user")
-                    assistant_messages = sum(1 for msg in messages if msg["role"] == "assistant")
-                    
-                    # Display stats
-                    stats_col1, stats_col2, stats_col3 = st.columns(3)
-                    with stats_col1:
-                        st.metric("Total Messages", len(messages))
-                    with stats_col2:
-                        st.metric("User Messages", user_messages)
-                    with stats_col3:
-                        st.metric("Assistant Messages", assistant_messages)
-                    
-                    # Display messages
-                    with st.container():
-                        for message in messages:
-                            with st.chat_message(message["role"]):
-                                st.markdown(message["content"])
-                    
-                    # Option to continue this conversation
-                    if st.button("Continue this conversation in Chat"):
-                        # Store the conversation in session state to be loaded in the Chat page
-                        st.session_state.messages = messages
-                        # Redirect to Chat page
-                        st.switch_page("pages/1_Chat.py")
-                        
-                except Exception as e:
-                    st.error(f"Error loading conversation: {str(e)}")
+                render_conversation(str(selected_file))
 
 # Import conversation
 st.markdown("---")
 st.subheader("Import Conversation")
 
-uploaded_conversation = st.file_uploader("Upload a conversation file", type=["json"])
+uploaded_conversation = st.file_uploader("Upload a conversation file", type=["jsonl", "json"])
 
 if uploaded_conversation and st.button("Import Conversation"):
     try:
-        # Read the uploaded JSON
-        conversation_data = json.loads(uploaded_conversation.getvalue().decode("utf-8"))
+        # Create a new file name based on current time
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        new_file_path = Path("conversations") / f"conversation_{timestamp}.jsonl"
         
-        # Validate the structure (basic check)
-        if isinstance(conversation_data, list) and all(isinstance(msg, dict) and "role" in msg and "content" in msg for msg in conversation_data):
-            # Create a new file name based on current time
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            new_file_path = Path("conversations") / f"conversation_{timestamp}.json"
-            
-            # Save the file
-            with open(new_file_path, "w") as f:
-                json.dump(conversation_data, f, indent=2)
-            
-            st.success(f"Conversation imported successfully as {new_file_path.name}")
-            st.experimental_rerun()
-        else:
-            st.error("The uploaded file is not a valid conversation file.")
+        # Validate the structure while streaming the messages to disk
+        save_conversation_stream(iter_uploaded_conversation(uploaded_conversation), new_file_path)
+        list_conversations.clear()
+        
+        st.success(f"Conversation imported successfully as {new_file_path.name}")
+        st.rerun()
+    except ValueError:
+        st.error("The uploaded file is not a valid conversation file.")
     except Exception as e:
         st.error(f"Error importing conversation: {str(e)}")
 
@@ -1,16 +1,20 @@
 import os
+import stat
 import streamlit as st
 from pathlib import Path
 import sys
-import json
+import shutil
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter, defaultdict
 
 # Add the parent directory to the path so we can import the helper modules
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
-from helper_functions import setup_logging, extract_text_from_file
-from index_functions import create_index, load_index, get_index_stats
-from document_processor import process_document, get_mistral_client
+from helper_functions import setup_logging, extract_text_from_file, iter_files, clone_file, json_loads, index_available, load_index_cached, SUPPORTED_EXTENSIONS
+from index_functions import create_index, get_index_stats
 
 # Setup
 logger = setup_logging()
@@ -35,6 +39,83 @@ def check_api_key():
 if not check_api_key():
     st.stop()
 
+def safe_stat(path):
+    """Return os.stat(path), or None if the file does not exist"""
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+def probe_index_files():
+    """Stat the index files once per rerun; call again after the index files are written or deleted"""
+    global INDEX_STAT, SUMMARY_STAT
+    INDEX_STAT = safe_stat("index.pkl")
+    SUMMARY_STAT = safe_stat("index_summary.json")
+
+probe_index_files()
+
+def index_mtime():
+    """Return the modification time of the index file, or None if there is no index"""
+    return INDEX_STAT.st_mtime if INDEX_STAT is not None else None
+
+# Index stats are cached on the index file's mtime, like the index itself, so reruns skip recomputing them
+@st.cache_data(show_spinner=False)
+def cached_index_stats(mtime):
+    return get_index_stats()
+
+def index_summary_preview(path="index_summary.json"):
+    """Return the scalar top-level fields of the index summary and its file count without loading the file list"""
+    try:
+        import ijson
+    except ImportError:
+        with open(path, "rb") as f:
+            summary = json_loads(f.read())
+        preview = {key: value for key, value in summary.items() if not isinstance(value, (list, dict))}
+        preview["files"] = f"{len(summary.get('files', []))} files"
+        return preview
+    
+    preview = {}
+    file_count = 0
+    with open(path, "rb") as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if prefix == "files.item":
+                file_count += 1
+            elif prefix and "." not in prefix and event in ("string", "number", "boolean", "null"):
+                preview[prefix] = value
+    preview["files"] = f"{file_count} files"
+    return preview
+
+# Document analysis calls the Mistral API, so cache it per file version to keep selectbox reruns cheap
+@st.cache_data(show_spinner="Analyzing document...", max_entries=64)
+def preview_document(file_path, mtime, _client):
+    # Import only if needed
+    from document_processor import process_document
+    return process_document(file_path, _client)
+
+def validated_dir(folder_path):
+    """Return the stat result for folder_path if it is an existing directory, otherwise None"""
+    try:
+        st_result = os.stat(folder_path)
+    except OSError:
+        return None
+    return st_result if stat.S_ISDIR(st_result.st_mode) else None
+
+# Number of indexed files listed in the "Indexed Files" expander
+MAX_LISTED_FILES = 1000
+
+# Stop counting files in "Validate Path" after this many so huge folders stay responsive
+MAX_VALIDATE_FILES = 100_000
+
+# Upper bound on threads used to save uploaded files
+MAX_SAVE_WORKERS = 8
+
+def save_uploaded_file(uploaded_file, directory):
+    """Stream an uploaded file to disk in 1 MiB chunks"""
+    file_path = directory / uploaded_file.name
+    with open(file_path, "wb", buffering=0) as f:
+        shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
+    return file_path
+
 # Sidebar
 with st.sidebar:
     st.title("Document Index")
@@ -47,6 +128,16 @@ with st.sidebar:
         help="When enabled, documents will be tokenized, summarized, and have keywords extracted"
     )
     
+    # Number of uploaded files indexed per batch
+    index_batch_size = st.number_input(
+        "Indexing Batch Size",
+        min_value=10,
+        max_value=5000,
+        value=500,
+        step=10,
+        help="Uploaded files are indexed in batches of this many files"
+    )
+    
     # Link back to chat
     st.markdown("---")
     st.markdown("[Back to Chat](/Chat)", unsafe_allow_html=True)
@@ -94,20 +185,46 @@ with tab1:
             
             # Save uploaded files to temp directory
             progress_text.text("Saving uploaded files...")
-            for i, uploaded_file in enumerate(uploaded_files):
-                file_path = temp_dir / uploaded_file.name
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                progress_bar.progress((i + 1) / len(uploaded_files))
+            # Saves run on a small thread pool; progress is reported from this thread as they finish
+            # The progress bar is updated at most ~100 times
+            progress_step = max(1, len(uploaded_files) // 100)
+            with ThreadPoolExecutor(max_workers=min(MAX_SAVE_WORKERS, len(uploaded_files))) as executor:
+                futures = [executor.submit(save_uploaded_file, uploaded_file, temp_dir) for uploaded_file in uploaded_files]
+                for i, future in enumerate(as_completed(futures)):
+                    future.result()
+                    if (i + 1) % progress_step == 0 or i == len(uploaded_files) - 1:
+                        progress_bar.progress((i + 1) / len(uploaded_files))
+            
+            # Index the files in batches so each batch's intermediate data can be freed before the next
+            with os.scandir(temp_dir) as it:
+                saved_paths = [entry.path for entry in it if entry.is_file()]
+            batches = [saved_paths[i:i + index_batch_size] for i in range(0, len(saved_paths), index_batch_size)]
             
-            # Index the files
-            progress_text.text("Indexing documents...")
-            create_index(str(temp_dir), logger, use_advanced_processing=use_advanced_processing)
+            progress_bar.progress(0)
+            # Append only once a batch has replaced the index, so a failed first batch cannot leave later ones appending to the old index
+            index_written = False
+            for batch_number, batch in enumerate(batches):
+                progress_text.text(f"Indexing documents (batch {batch_number + 1} of {len(batches)})...")
+                with st.status(f"Indexing batch {batch_number + 1} of {len(batches)}..."):
+                    written = create_index(
+                        str(temp_dir),
+                        logger,
+                        use_advanced_processing=use_advanced_processing,
+                        files=batch,
+                        append=index_written
+                    )
+                index_written = index_written or written
+                progress_bar.progress((batch_number + 1) / len(batches))
+            probe_index_files()
+            cached_index_stats.clear()
             
             # Show success message
             progress_text.empty()
             progress_bar.empty()
-            st.success(f"Indexed {len(uploaded_files)} documents successfully!")
+            if index_written:
+                st.success(f"Indexed {len(uploaded_files)} documents successfully!")
+            else:
+                st.error("No documents could be indexed.")
 
 # Tab 2: Index Folder
 with tab2:
@@ -119,21 +236,19 @@ with tab2:
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Validate Path", key="validate_path") and folder_path:
-            path = Path(folder_path)
-            if path.exists() and path.is_dir():
-                # Get file count and types
-                files = list(path.glob("**/*"))
-                files = [f for f in files if f.is_file()]
-                
-                file_types = {}
-                for f in files:
-                    ext = f.suffix.lower()
-                    if ext in file_types:
-                        file_types[ext] += 1
-                    else:
-                        file_types[ext] = 1
+            if validated_dir(folder_path):
+                # Get file count and types in a single directory walk
+                file_types = Counter()
+                total = 0
+                for entry in iter_files(folder_path, SUPPORTED_EXTENSIONS):
+                    # iter_files only yields names with a supported extension, so the last dot starts it
+                    file_types["." + entry.name.rpartition(".")[2].lower()] += 1
+                    total += 1
+                    if total >= MAX_VALIDATE_FILES:
+                        st.warning(f"Large folder; stopped counting after {MAX_VALIDATE_FILES:,} files, showing partial stats")
+                        break
                 
-                st.success(f"Valid folder with {len(files)} files")
+                st.success(f"Valid folder with {total} supported files")
                 st.write("File types found:")
                 for ext, count in file_types.items():
                     st.write(f"- {ext}: {count} files")
@@ -152,21 +267,29 @@ with tab2:
         use_adv_process = process_option == "Advanced Processing"
         
         if st.button("Index Folder", key="index_folder") and folder_path:
-            path = Path(folder_path)
-            if path.exists() and path.is_dir():
+            if validated_dir(folder_path):
                 with st.status("Indexing folder..."):
                     create_index(folder_path, logger, use_advanced_processing=use_adv_process)
+                probe_index_files()
+                cached_index_stats.clear()
                 st.success(f"Folder indexed successfully!")
             else:
                 st.error("Invalid folder path or folder doesn't exist")
 
 # Tab 3: Index Status
-with tab3:
-    st.header("Index Status")
+# Runs as a fragment so refreshing the status does not rerun the other tabs
+@st.fragment
+def render_index_status():
+    """Index status panel, rerun on its own"""
+    # Fragment reruns skip the probe at the top of the page
+    probe_index_files()
     
+    # Keep the panel open once refreshed, so its own widgets (such as the full summary checkbox) can rerun the fragment
     if st.button("Refresh Index Status", key="refresh_status"):
-        if load_index():
-            stats = get_index_stats()
+        st.session_state.show_index_status = True
+    if st.session_state.get("show_index_status"):
+        if index_available(index_mtime()):
+            stats = cached_index_stats(index_mtime())
             if stats:
                 st.success("Index is loaded and ready to use.")
                 
@@ -203,18 +326,22 @@ with tab3:
                 
                 # Display indexed files
                 with st.expander("Indexed Files"):
-                    for file_path in stats["files"]:
-                        st.text(file_path)
+                    files_listing = "\n".join(stats["files"][:MAX_LISTED_FILES])
+                    if len(stats["files"]) > MAX_LISTED_FILES:
+                        files_listing += f"\n... and {len(stats['files']) - MAX_LISTED_FILES} more"
+                    st.code(files_listing, language=None)
                 
                 # Display summary
                 st.subheader("Index Summary")
                 
-                # Try to load the index summary
-                if os.path.exists("index_summary.json"):
+                # Try to load the index summary; only the top-level fields are parsed unless asked for
+                if SUMMARY_STAT is not None:
                     try:
-                        with open("index_summary.json", "r") as f:
-                            summary = json.load(f)
-                        st.json(summary)
+                        st.json(index_summary_preview())
+                        if st.checkbox("Show full index summary", key="show_full_summary"):
+                            with open("index_summary.json", "rb") as f:
+                                summary = json_loads(f.read())
+                            st.json(summary)
                     except:
                         st.warning("Could not load detailed index summary.")
             else:
@@ -222,23 +349,31 @@ with tab3:
         else:
             st.error("No index found. Please index documents first.")
 
+with tab3:
+    st.header("Index Status")
+    render_index_status()
+
 # Tab 4: Document Preview
 with tab4:
     st.header("Document Preview")
     st.markdown("Preview and analyze individual documents")
     
-    if load_index():
-        stats = get_index_stats()
+    if index_available(index_mtime()):
+        stats = cached_index_stats(index_mtime())
         if stats and stats["files"]:
             # Create a select box with available files
             selected_file = st.selectbox("Select a document to preview", stats["files"])
             
             if selected_file:
                 # Process the selected document to get preview
+                from document_processor import get_mistral_client
                 client = get_mistral_client()
                 
-                with st.status("Analyzing document..."):
-                    doc_info = process_document(selected_file, client)
+                try:
+                    file_mtime = os.path.getmtime(selected_file)
+                except OSError:
+                    file_mtime = None
+                doc_info = preview_document(selected_file, file_mtime, client)
                 
                 if doc_info and doc_info["processed"]:
                     # Display document information
@@ -274,8 +409,14 @@ with tab4:
                     if doc_info.get("chunks"):
                         st.subheader("Document Chunks")
                         
-                        # Group chunks by level
-                        level_0_chunks = [c for c in doc_info["chunks"] if c["level"] == 0]
+                        # Group chunks by level, bucketing sub-chunks by parent in the same pass
+                        level_0_chunks = []
+                        child_chunks_by_parent = defaultdict(list)
+                        for c in doc_info["chunks"]:
+                            if c["level"] == 0:
+                                level_0_chunks.append(c)
+                            elif c["level"] == 1:
+                                child_chunks_by_parent[c.get("parent_index")].append(c)
                         
                         for i, chunk in enumerate(level_0_chunks):
                             with st.expander(f"Chunk {i+1} (Level 0)"):
@@ -284,8 +425,7 @@ with tab4:
                                             height=150)
                                 
                                 # Find child chunks if any
-                                child_chunks = [c for c in doc_info["chunks"] 
-                                              if c["level"] == 1 and c.get("parent_index") == i]
+                                child_chunks = child_chunks_by_parent.get(i, ())
                                 
                                 if child_chunks:
                                     st.write(f"This chunk has {len(child_chunks)} sub-chunks")
@@ -296,60 +436,40 @@ with tab4:
     else:
         st.error("No index found. Please index documents first.")
 
-# Tab 5: Manage Index
-with tab5:
-    st.header("Manage Index")
-    
-    col1, col2 = st.columns(2)
+# Tab 5 export and advanced options run as fragments so their buttons do not rerun the other tabs
+@st.fragment
+def render_export_summary():
+    """Export button for the index summary, rerun on its own"""
+    probe_index_files()
     
-    with col1:
-        if st.button("Reset Index", key="reset_index"):
-            # Ask for confirmation
-            if st.checkbox("Confirm reset - this will delete your entire document index"):
-                # Delete index files
-                index_files = ["index.pkl", "index_summary.json"]
-                deleted = False
-                
-                for file in index_files:
-                    if os.path.exists(file):
-                        os.remove(file)
-                        deleted = True
-                
-                if deleted:
-                    st.success("Index has been reset successfully.")
-                else:
-                    st.info("No index files found to delete.")
-    
-    with col2:
-        if st.button("Export Index Summary", key="export_summary"):
-            if os.path.exists("index_summary.json"):
-                try:
-                    with open("index_summary.json", "r") as f:
-                        summary = json.load(f)
-                    
-                    # Convert to string for download
-                    import json
-                    json_str = json.dumps(summary, indent=2)
-                    
-                    # Create download button
+    if st.button("Export Index Summary", key="export_summary"):
+        if SUMMARY_STAT is not None:
+            try:
+                # Hand the file straight to the download button instead of re-encoding it
+                with open("index_summary.json", "rb") as f:
                     st.download_button(
                         label="Download Index Summary",
-                        data=json_str,
+                        data=f,
                         file_name="index_summary.json",
                         mime="application/json"
                     )
-                except:
-                    st.warning("Could not load index summary for export.")
-            else:
-                st.error("No index summary file found. Please index documents first.")
+            except:
+                st.warning("Could not load index summary for export.")
+        else:
+            st.error("No index summary file found. Please index documents first.")
+
+@st.fragment
+def render_advanced_options():
+    """Re-process and backup buttons, rerun on their own"""
+    probe_index_files()
     
     # Advanced index management options
     st.subheader("Advanced Options")
     
     # Re-process index with advanced processing
     if st.button("Re-process Index with Advanced Processing"):
-        if load_index():
-            stats = get_index_stats()
+        if index_available(index_mtime()):
+            stats = cached_index_stats(index_mtime())
             if stats and not stats.get("has_summaries") and not stats.get("has_keywords"):
                 with st.status("Re-processing index with advanced processing..."):
                     # This would need to be implemented in index_functions.py
@@ -362,17 +482,14 @@ with tab5:
     
     # Create backup of index
     if st.button("Create Index Backup"):
-        if os.path.exists("index.pkl"):
+        if INDEX_STAT is not None:
             try:
-                import shutil
-                import datetime
-                
                 # Create backup timestamp
                 timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
                 backup_file = f"index_backup_{timestamp}.pkl"
                 
-                # Copy index file
-                shutil.copy2("index.pkl", backup_file)
+                # Copy index file (reflink or hardlink where possible)
+                clone_file("index.pkl", backup_file)
                 
                 st.success(f"Index backup created: {backup_file}")
             except Exception as e:
@@ -380,6 +497,40 @@ with tab5:
         else:
             st.error("No index file found to backup")
 
+# Tab 5: Manage Index
+with tab5:
+    st.header("Manage Index")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("Reset Index", key="reset_index"):
+            # Ask for confirmation
+            if st.checkbox("Confirm reset - this will delete your entire document index"):
+                # Delete index files
+                index_files = ["index.pkl", "index_summary.json"]
+                deleted = False
+                
+                for file in index_files:
+                    try:
+                        os.remove(file)
+                        deleted = True
+                    except FileNotFoundError:
+                        pass
+                
+                if deleted:
+                    probe_index_files()
+                    load_index_cached.clear()
+                    cached_index_stats.clear()
+                    st.success("Index has been reset successfully.")
+                else:
+                    st.info("No index files found to delete.")
+    
+    with col2:
+        render_export_summary()
+    
+    render_advanced_options()
+
 # Add helpful information
 st.markdown("---")
 with st.expander("About Document Indexing and Processing"):
@@ -1,21 +1,111 @@
 import os
 import streamlit as st
-from mistralai import Mistral
-import json
-from pathlib import Path
 import sys
 import datetime
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the parent directory to the path so we can import the helper modules
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
-from helper_functions import setup_logging, load_config
-from index_functions import search_index, load_index
+from helper_functions import (
+    setup_logging,
+    file_mtime,
+    cached_config,
+    index_available,
+    ensure_conversations_dir,
+    conversations_dir_mtime,
+    scan_conversations,
+    load_conversation,
+    count_conversation_messages,
+    json_dumps,
+)
+from index_functions import search_index
+
+# Logging is configured once per process
+@st.cache_resource
+def get_logger():
+    return setup_logging()
+
+# System prompts for each conversation report type and custom report format, in display order
+CONVERSATION_REPORT_PROMPTS = {
+    "Executive Summary": "You are an executive assistant tasked with creating a concise executive summary of a conversation. Focus on the main points, decisions, and outcomes. The summary should be professional and to the point.",
+    "Detailed Analysis": "You are a business analyst tasked with creating a detailed analysis of a conversation. Analyze the main topics, insights, challenges, and opportunities discussed. Include recommendations where appropriate.",
+    "Key Points": "You are a note-taker tasked with extracting key points from a conversation. Create a bulleted list of the most important points, organized by topic.",
+    "Action Items": "You are a project manager tasked with extracting action items from a conversation. Create a list of specific tasks, who is responsible (if mentioned), and any deadlines or priorities (if mentioned).",
+}
+
+CUSTOM_REPORT_PROMPTS = {
+    "Standard Report": "You are a professional report writer tasked with creating a clear and well-structured report.",
+    "Bulleted Summary": "You are a professional summarizer tasked with creating a concise, bullet-point summary of information.",
+    "FAQ Style": "You are a knowledge base manager tasked with organizing information into a FAQ format with questions and detailed answers.",
+    "Technical Documentation": "You are a technical writer tasked with creating clear, precise documentation with appropriate technical details and explanations.",
+    "Newsletter": "You are a newsletter editor tasked with creating an engaging newsletter with key information and highlights.",
+    "Academic Paper": "You are an academic researcher tasked with organizing information into a formal academic paper structure.",
+}
+
+# Prompt templates, filled in with str.format when a report is generated
+CONVERSATION_REPORT_TEMPLATE = """
+Based on the following conversation, create a {report_type}.
+
+{timestamps}
+
+Format the report in Markdown with clear headings, bullet points, and sections.
+"""
+
+# (system prompt, prompt template) for each document analysis type
+DOCUMENT_ANALYSIS_PROMPTS = {
+    "Summary": (
+        "You are a research assistant tasked with creating a concise summary of documents related to a specific topic. Focus on the main points and insights.",
+        """
+Create a comprehensive summary of the following documents related to: "{query}".
+
+Organize the summary with clear headings and sections. Include citations to the source documents where appropriate.
+Format the report in Markdown.
+"""
+    ),
+    "Key Concepts": (
+        "You are a knowledge manager tasked with extracting and explaining key concepts from documents related to a specific topic.",
+        """
+Extract and explain the key concepts from the following documents related to: "{query}".
+
+For each key concept:
+1. Provide a clear definition
+2. Explain its significance
+3. Note how it relates to other concepts (if applicable)
+
+Format the report in Markdown with clear headings for each concept.
+"""
+    ),
+}
+
+COMPARISON_SYSTEM_PROMPT = "You are a research analyst tasked with comparing and contrasting two topics based on document evidence."
+
+COMPARISON_TEMPLATE = """
+Create a comparative analysis between "{query1}" and "{query2}" based on the provided documents.
+
+Include the following sections:
+1. Overview of each topic
+2. Similarities
+3. Differences
+4. Implications or insights from this comparison
+
+Format the report in Markdown with clear headings and tables where appropriate.
+"""
+
+CUSTOM_REPORT_TEMPLATE = """
+Create a {report_format} titled "{report_title}" based on the following information.
+
+{additional_instructions}
+
+Format the report in Markdown with appropriate headings, sections, and formatting.
+"""
 
 # Setup
-logger = setup_logging()
-config = load_config()
+logger = get_logger()
+config = cached_config(file_mtime("config.json"))
 
 # Page configuration
 st.set_page_config(
@@ -31,6 +121,9 @@ def get_mistral_client():
     if not api_key:
         st.error("Missing API key. Please set your Mistral API Key on the Home page.")
         return None
+    
+    # Import only if needed
+    from mistralai import Mistral
     return Mistral(api_key=api_key)
 
 # Check if the client is available
@@ -38,6 +131,147 @@ client = get_mistral_client()
 if not client:
     st.stop()
 
+# Load the index once per rerun; both the Document Analysis tab and the Documents source branch on this
+index_ready = index_available(file_mtime("index.pkl"))
+NO_INDEX_WARNING = "No document index found. Please index documents first in the Document Index page."
+
+# Upper bound on threads used to read conversation metadata
+MAX_SCAN_WORKERS = 16
+
+@st.cache_data(ttl=60, show_spinner=False)
+def list_conversations(dir_mtime_ns):
+    """
+    Return (date label, path, mtime, message count) tuples for saved conversations, newest first
+    
+    The mtimes come from the directory scan and counts from the metadata sidecars, so no conversation
+    is parsed here. dir_mtime_ns is only part of the cache key, so the scan is redone whenever a file
+    is added or removed.
+    """
+    entries = scan_conversations()
+    
+    def count_one(path):
+        try:
+            return count_conversation_messages(path)
+        except Exception:
+            # Skip invalid files
+            return None
+    
+    # Sidecar reads (and the occasional backfill) are I/O bound, so overlap them on a thread pool
+    with ThreadPoolExecutor(max_workers=min(MAX_SCAN_WORKERS, max(1, len(entries)))) as executor:
+        counts = list(executor.map(count_one, [path for _, path in entries]))
+    
+    return [
+        (datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"), path, timestamp, n_messages)
+        for (timestamp, path), n_messages in zip(entries, counts)
+        if n_messages is not None
+    ]
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_selected_conversation(path, mtime):
+    """Parse the selected conversation (mtime is only part of the cache key)"""
+    return load_conversation(path)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_search(query, top_k, index_mtime):
+    # Only runs on a cache miss; the hash lets the hit rate be checked in the logs without logging queries
+    logger.info(f"Search cache miss for query {hashlib.md5(query.encode()).hexdigest()[:8]} (top_k={top_k})")
+    return search_index(query, logger, top_k=top_k)
+
+def cached_search(query, top_k):
+    """Search the index, reusing results for repeated queries until the index file changes"""
+    return _cached_search(query, top_k, file_mtime("index.pkl"))
+
+# Conversations sent for reports are cut to roughly this many tokens, estimated at CHARS_PER_TOKEN characters each
+REPORT_INPUT_TOKEN_BUDGET = 8000
+CHARS_PER_TOKEN = 4
+
+def conversation_text_within_budget(messages, budget_tokens=REPORT_INPUT_TOKEN_BUDGET):
+    """Format the most recent messages that fit the token budget, noting how many earlier ones were left out"""
+    budget_chars = budget_tokens * CHARS_PER_TOKEN
+    lines = []
+    used = 0
+    for msg in reversed(messages):
+        line = f"{msg['role'].upper()}: {msg['content']}"
+        if used + len(line) > budget_chars:
+            if not lines:
+                # Always keep the latest message, cut to the budget
+                lines.append(line[:budget_chars])
+            break
+        lines.append(line)
+        used += len(line) + 2
+    
+    omitted = len(messages) - len(lines)
+    lines.reverse()
+    if omitted:
+        lines.insert(0, f"[... {omitted} earlier messages omitted ...]")
+    return "\n\n".join(lines)
+
+def next_report_stamp():
+    """Return a unique stamp for report file names: the session's start time plus a per-session counter"""
+    if "report_session_prefix" not in st.session_state:
+        st.session_state.report_session_prefix = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        st.session_state.report_counter = 0
+    st.session_state.report_counter += 1
+    return f"{st.session_state.report_session_prefix}_{st.session_state.report_counter:04d}"
+
+def remember_report(slot, title, content, filename):
+    """Keep the report generated in a tab so it can be shown again after later reruns"""
+    st.session_state[slot] = {"title": title, "content": content, "filename": filename}
+
+def render_last_report(slot):
+    """Offer the tab's last generated report; its markdown is only rendered when asked for"""
+    report = st.session_state.get(slot)
+    if not report:
+        return
+    
+    st.download_button(
+        label=f"Download last report: {report['title']}",
+        data=report["content"].encode("utf-8"),
+        file_name=report["filename"],
+        mime="text/markdown; charset=utf-8",
+        key=f"{slot}_download"
+    )
+    if st.checkbox("Show last report", key=f"{slot}_show"):
+        st.markdown(report["content"])
+
+# Number of generated reports kept per session so an unchanged request is answered without an API call
+MAX_CACHED_REPORTS = 32
+
+def stream_completion(messages, temperature, max_tokens):
+    """
+    Stream a chat completion into the page as it is generated and return the full text
+    
+    Responses are cached in the session keyed on a hash of the request, so regenerating an unchanged
+    report shows the previous result instead of calling the API again.
+    """
+    request_key = hashlib.sha256(json_dumps([config["model"], temperature, max_tokens, messages], indent=False)).hexdigest()
+    response_cache = st.session_state.setdefault("report_response_cache", {})
+    if request_key in response_cache:
+        st.markdown(response_cache[request_key])
+        return response_cache[request_key]
+    
+    placeholder = st.empty()
+    chunks = []
+    stream = client.chat.stream(
+        model=config["model"],
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens
+    )
+    for event in stream:
+        delta = event.data.choices[0].delta.content
+        if delta:
+            chunks.append(delta)
+            placeholder.markdown("".join(chunks))
+    content = "".join(chunks)
+    
+    if content:
+        # Evict the oldest cached report once the cache is full
+        if len(response_cache) >= MAX_CACHED_REPORTS:
+            response_cache.pop(next(iter(response_cache)))
+        response_cache[request_key] = content
+    return content
+
 # Sidebar
 with st.sidebar:
     st.title("Report Generation")
@@ -57,86 +291,69 @@ tab1, tab2, tab3 = st.tabs(["Conversation Summary", "Document Analysis", "Custom
 with tab1:
     st.header("Conversation Summary Report")
     st.markdown("Generate a summary report from a saved conversation")
+    render_last_report("last_report_conversation")
     
     # Get list of saved conversations
-    os.makedirs("conversations", exist_ok=True)
-    conversation_files = list(Path("conversations").glob("*.json"))
-    conversation_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+    ensure_conversations_dir()
+    conversations = list_conversations(conversations_dir_mtime())
     
-    if not conversation_files:
+    if not conversations:
         st.info("No saved conversations found. You can save conversations from the Chat page.")
     else:
-        # Create select box with conversation dates
-        conversation_options = []
-        for file in conversation_files:
-            try:
-                # Get creation time
-                timestamp = file.stat().st_mtime
-                date_str = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-                
-                # Get message count
-                with open(file, "r") as f:
-                    messages = json.load(f)
-                
-                # Create option label
-                label = f"{date_str} ({len(messages)} messages)"
-                conversation_options.append((label, file, messages))
-            except:
-                # Skip invalid files
-                continue
+        # Create select box with conversation dates and message counts
+        conversation_options = [
+            (f"{date_str} ({n_messages} messages)", file, mtime)
+            for date_str, file, mtime, n_messages in conversations
+        ]
         
         if conversation_options:
             # Extract just the labels for the selectbox
             labels = [label for label, _, _ in conversation_options]
             selected_label = st.selectbox("Select conversation", labels)
             
-            # Find the selected file and messages
-            selected_data = next((data for label, _, data in conversation_options if label == selected_label), None)
+            # Find the selected file and parse only that one, reusing the mtime from the directory scan
+            selected = next(((file, mtime) for label, file, mtime in conversation_options if label == selected_label), None)
+            try:
+                selected_data = load_selected_conversation(*selected) if selected else None
+            except Exception:
+                st.error("Error loading conversation.")
+                selected_data = None
             
             if selected_data:
                 # Display options for report generation
                 st.subheader("Report Options")
                 
-                report_type = st.radio(
-                    "Report Type",
-                    options=["Executive Summary", "Detailed Analysis", "Key Points", "Action Items"]
-                )
-                
-                include_timestamps = st.checkbox("Include timestamps", value=False)
+                # Options are collected in a form so changing them does not rerun the page
+                with st.form("conversation_report_options"):
+                    report_type = st.radio(
+                        "Report Type",
+                        options=list(CONVERSATION_REPORT_PROMPTS)
+                    )
+                    
+                    include_timestamps = st.checkbox("Include timestamps", value=False)
+                    
+                    generate_report = st.form_submit_button("Generate Report")
                 
-                if st.button("Generate Report"):
+                if generate_report:
                     with st.status("Generating report..."):
                         # Prepare prompt based on report type
-                        if report_type == "Executive Summary":
-                            system_prompt = "You are an executive assistant tasked with creating a concise executive summary of a conversation. Focus on the main points, decisions, and outcomes. The summary should be professional and to the point."
-                        elif report_type == "Detailed Analysis":
-                            system_prompt = "You are a business analyst tasked with creating a detailed analysis of a conversation. Analyze the main topics, insights, challenges, and opportunities discussed. Include recommendations where appropriate."
-                        elif report_type == "Key Points":
-                            system_prompt = "You are a note-taker tasked with extracting key points from a conversation. Create a bulleted list of the most important points, organized by topic."
-                        else:  # Action Items
-                            system_prompt = "You are a project manager tasked with extracting action items from a conversation. Create a list of specific tasks, who is responsible (if mentioned), and any deadlines or priorities (if mentioned)."
+                        system_prompt = CONVERSATION_REPORT_PROMPTS[report_type]
                         
                         # Create a prompt for the report
-                        prompt = f"""
-                        Based on the following conversation, create a {report_type}.
+                        prompt = CONVERSATION_REPORT_TEMPLATE.format(
+                            report_type=report_type,
+                            timestamps="Include timestamps in the report." if include_timestamps else ""
+                        )
                         
-                        {f"Include timestamps in the report." if include_timestamps else ""}
-                        
-                        Format the report in Markdown with clear headings, bullet points, and sections.
-                        """
-                        
-                        # Prepare the conversation as context
-                        conversation_text = ""
-                        for msg in selected_data:
-                            role = msg["role"]
-                            content = msg["content"]
-                            conversation_text += f"{role.upper()}: {content}\n\n"
+                        # Prepare the most recent part of the conversation that fits the input budget as context
+                        conversation_text = conversation_text_within_budget(selected_data)
                         
                         # Get response from Mistral
                         try:
-                            response = client.chat.complete(
-                                model=config["model"],
-                                messages=[
+                            # Display the report as it is generated
+                            st.subheader(f"{report_type} Report")
+                            report_content = stream_completion(
+                                [
                                     {"role": "system", "content": system_prompt},
                                     {"role": "user", "content": prompt + "\n\nCONVERSATION:\n" + conversation_text}
                                 ],
@@ -144,22 +361,17 @@ with tab1:
                                 max_tokens=2000
                             )
                             
-                            report_content = response.choices[0].message.content
-                            
-                            # Display the report
-                            st.subheader(f"{report_type} Report")
-                            st.markdown(report_content)
-                            
                             # Provide download option
-                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                            timestamp = next_report_stamp()
                             report_filename = f"{report_type.lower().replace(' ', '_')}_{timestamp}.md"
                             
                             st.download_button(
                                 label="Download Report",
-                                data=report_content,
+                                data=report_content.encode("utf-8"),
                                 file_name=report_filename,
-                                mime="text/markdown"
+                                mime="text/markdown; charset=utf-8"
                             )
+                            remember_report("last_report_conversation", f"{report_type} Report", report_content, report_filename)
                             
                         except Exception as e:
                             st.error(f"Error generating report: {str(e)}")
@@ -170,12 +382,10 @@ with tab1:
 with tab2:
     st.header("Document Analysis Report")
     st.markdown("Generate an analysis report from your indexed documents")
+    render_last_report("last_report_documents")
     
-    # Check if index is loaded
-    index_loaded = load_index()
-    
-    if not index_loaded:
-        st.warning("No document index found. Please index documents first in the Document Index page.")
+    if not index_ready:
+        st.warning(NO_INDEX_WARNING)
     else:
         # Display options for document analysis
         st.subheader("Analysis Options")
@@ -186,45 +396,31 @@ with tab2:
         )
         
         # For summary and key concepts, we need a query to find relevant documents
-        if analysis_type in ["Summary", "Key Concepts"]:
-            query = st.text_input("Enter a topic or query to analyze", 
-                                 help="This will be used to find relevant documents in your index")
+        if analysis_type in DOCUMENT_ANALYSIS_PROMPTS:
+            with st.form("document_analysis_options"):
+                query = st.text_input("Enter a topic or query to analyze", 
+                                     help="This will be used to find relevant documents in your index")
+                
+                generate_analysis = st.form_submit_button("Generate Analysis")
             
-            if st.button("Generate Analysis") and query:
+            if generate_analysis and query:
                 with st.status("Searching documents and generating analysis..."):
                     # Search for relevant documents
-                    context = search_index(query, logger, top_k=5)
+                    context = cached_search(query, 5)
                     
                     if not context:
                         st.error("No relevant documents found. Try a different query.")
                     else:
                         # Prepare prompt based on analysis type
-                        if analysis_type == "Summary":
-                            system_prompt = "You are a research assistant tasked with creating a concise summary of documents related to a specific topic. Focus on the main points and insights."
-                            prompt = f"""
-                            Create a comprehensive summary of the following documents related to: "{query}".
-                            
-                            Organize the summary with clear headings and sections. Include citations to the source documents where appropriate.
-                            Format the report in Markdown.
-                            """
-                        else:  # Key Concepts
-                            system_prompt = "You are a knowledge manager tasked with extracting and explaining key concepts from documents related to a specific topic."
-                            prompt = f"""
-                            Extract and explain the key concepts from the following documents related to: "{query}".
-                            
-                            For each key concept:
-                            1. Provide a clear definition
-                            2. Explain its significance
-                            3. Note how it relates to other concepts (if applicable)
-                            
-                            Format the report in Markdown with clear headings for each concept.
-                            """
+                        system_prompt, prompt_template = DOCUMENT_ANALYSIS_PROMPTS[analysis_type]
+                        prompt = prompt_template.format(query=query)
                         
                         # Get response from Mistral
                         try:
-                            response = client.chat.complete(
-                                model=config["model"],
-                                messages=[
+                            # Display the analysis as it is generated
+                            st.subheader(f"{analysis_type} Report")
+                            analysis_content = stream_completion(
+                                [
                                     {"role": "system", "content": system_prompt},
                                     {"role": "user", "content": prompt + "\n\nDOCUMENTS:\n" + context}
                                 ],
@@ -232,63 +428,54 @@ with tab2:
                                 max_tokens=2000
                             )
                             
-                            analysis_content = response.choices[0].message.content
-                            
-                            # Display the analysis
-                            st.subheader(f"{analysis_type} Report")
-                            st.markdown(analysis_content)
-                            
                             # Provide download option
-                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                            timestamp = next_report_stamp()
                             analysis_filename = f"{analysis_type.lower()}_{timestamp}.md"
                             
                             st.download_button(
                                 label="Download Analysis",
-                                data=analysis_content,
+                                data=analysis_content.encode("utf-8"),
                                 file_name=analysis_filename,
-                                mime="text/markdown"
+                                mime="text/markdown; charset=utf-8"
                             )
+                            remember_report("last_report_documents", f"{analysis_type} Report", analysis_content, analysis_filename)
                             
                         except Exception as e:
                             st.error(f"Error generating analysis: {str(e)}")
         
         # For comparative analysis, we need two queries
         else:  # Comparative Analysis
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                query1 = st.text_input("First topic", help="Enter the first topic to compare")
-            
-            with col2:
-                query2 = st.text_input("Second topic", help="Enter the second topic to compare")
+            with st.form("comparative_analysis_options"):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    query1 = st.text_input("First topic", help="Enter the first topic to compare")
+                
+                with col2:
+                    query2 = st.text_input("Second topic", help="Enter the second topic to compare")
+                
+                generate_comparison = st.form_submit_button("Generate Comparison")
             
-            if st.button("Generate Comparison") and query1 and query2:
+            if generate_comparison and query1 and query2:
                 with st.status("Searching documents and generating comparison..."):
-                    # Search for relevant documents for both topics
-                    context1 = search_index(query1, logger, top_k=3)
-                    context2 = search_index(query2, logger, top_k=3)
+                    # Search for relevant documents for both topics concurrently; each search waits on an embedding call
+                    with ThreadPoolExecutor(max_workers=2) as executor:
+                        future1 = executor.submit(cached_search, query1, 3)
+                        future2 = executor.submit(cached_search, query2, 3)
+                        context1, context2 = future1.result(), future2.result()
                     
                     if not context1 or not context2:
                         st.error("Insufficient relevant documents found for one or both topics.")
                     else:
-                        system_prompt = "You are a research analyst tasked with comparing and contrasting two topics based on document evidence."
-                        prompt = f"""
-                        Create a comparative analysis between "{query1}" and "{query2}" based on the provided documents.
-                        
-                        Include the following sections:
-                        1. Overview of each topic
-                        2. Similarities
-                        3. Differences
-                        4. Implications or insights from this comparison
-                        
-                        Format the report in Markdown with clear headings and tables where appropriate.
-                        """
+                        system_prompt = COMPARISON_SYSTEM_PROMPT
+                        prompt = COMPARISON_TEMPLATE.format(query1=query1, query2=query2)
                         
                         # Get response from Mistral
                         try:
-                            response = client.chat.complete(
-                                model=config["model"],
-                                messages=[
+                            # Display the comparison as it is generated
+                            st.subheader("Comparative Analysis Report")
+                            comparison_content = stream_completion(
+                                [
                                     {"role": "system", "content": system_prompt},
                                     {"role": "user", "content": prompt + f"\n\nDOCUMENTS ON {query1}:\n{context1}\n\nDOCUMENTS ON {query2}:\n{context2}"}
                                 ],
@@ -296,22 +483,17 @@ with tab2:
                                 max_tokens=2000
                             )
                             
-                            comparison_content = response.choices[0].message.content
-                            
-                            # Display the comparison
-                            st.subheader("Comparative Analysis Report")
-                            st.markdown(comparison_content)
-                            
                             # Provide download option
-                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                            timestamp = next_report_stamp()
                             comparison_filename = f"comparison_{timestamp}.md"
                             
                             st.download_button(
                                 label="Download Comparison",
-                                data=comparison_content,
+                                data=comparison_content.encode("utf-8"),
                                 file_name=comparison_filename,
-                                mime="text/markdown"
+                                mime="text/markdown; charset=utf-8"
                             )
+                            remember_report("last_report_documents", "Comparative Analysis Report", comparison_content, comparison_filename)
                             
                         except Exception as e:
                             st.error(f"Error generating comparison: {str(e)}")
@@ -320,6 +502,7 @@ with tab2:
 with tab3:
     st.header("Custom Report")
     st.markdown("Generate a custom report based on your specifications")
+    render_last_report("last_report_custom")
     
     # Report title
     report_title = st.text_input("Report Title", "Custom Analysis Report")
@@ -333,48 +516,30 @@ with tab3:
     # Input content based on selected source
     if input_source == "Conversation":
         # Get list of saved conversations
-        os.makedirs("conversations", exist_ok=True)
-        conversation_files = list(Path("conversations").glob("*.json"))
-        conversation_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+        ensure_conversations_dir()
+        conversations = list_conversations(conversations_dir_mtime())
         
-        if not conversation_files:
+        if not conversations:
             st.info("No saved conversations found. You can save conversations from the Chat page.")
             input_content = ""
         else:
             # Create select box with conversation dates
-            conversation_options = []
-            for file in conversation_files:
-                try:
-                    # Get creation time
-                    timestamp = file.stat().st_mtime
-                    date_str = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # Create option label
-                    label = f"{date_str}"
-                    conversation_options.append((label, file))
-                except:
-                    # Skip invalid files
-                    continue
+            conversation_options = [(date_str, file, mtime) for date_str, file, mtime, _ in conversations]
             
             if conversation_options:
                 # Extract just the labels for the selectbox
-                labels = [label for label, _ in conversation_options]
+                labels = [label for label, _, _ in conversation_options]
                 selected_label = st.selectbox("Select conversation", labels)
                 
-                # Find the selected file
-                selected_file = next((file for label, file in conversation_options if label == selected_label), None)
+                # Find the selected file and its mtime from the directory scan
+                selected_file, selected_mtime = next(((file, mtime) for label, file, mtime in conversation_options if label == selected_label), (None, None))
                 
                 # Load the conversation
                 try:
-                    with open(selected_file, "r") as f:
-                        messages = json.load(f)
+                    messages = load_selected_conversation(selected_file, selected_mtime)
                     
                     # Convert messages to text
-                    input_content = ""
-                    for msg in messages:
-                        role = msg["role"]
-                        content = msg["content"]
-                        input_content += f"{role.upper()}: {content}\n\n"
+                    input_content = conversation_text_within_budget(messages)
                 except:
                     st.error("Error loading conversation.")
                     input_content = ""
@@ -383,11 +548,8 @@ with tab3:
                 input_content = ""
     
     elif input_source == "Documents":
-        # Check if index is loaded
-        index_loaded = load_index()
-        
-        if not index_loaded:
-            st.warning("No document index found. Please index documents first in the Document Index page.")
+        if not index_ready:
+            st.warning(NO_INDEX_WARNING)
             input_content = ""
         else:
             query = st.text_input("Enter a topic or query to analyze",
@@ -395,7 +557,7 @@ with tab3:
             
             if query:
                 # Search for relevant documents
-                context = search_index(query, logger, top_k=5)
+                context = cached_search(query, 5)
                 
                 if not context:
                     st.error("No relevant documents found. Try a different query.")
@@ -411,56 +573,41 @@ with tab3:
     # Report format and structure
     st.subheader("Report Format")
     
-    report_format = st.selectbox(
-        "Report Format",
-        options=[
-            "Standard Report", 
-            "Bulleted Summary", 
-            "FAQ Style",
-            "Technical Documentation",
-            "Newsletter",
-            "Academic Paper"
-        ]
-    )
-    
-    # Additional instructions
-    additional_instructions = st.text_area(
-        "Additional Instructions (optional)",
-        placeholder="Add any specific requirements or instructions for the report...",
-        height=100
-    )
+    # Format options are collected in a form so editing them does not rerun the page
+    with st.form("custom_report_options"):
+        report_format = st.selectbox(
+            "Report Format",
+            options=list(CUSTOM_REPORT_PROMPTS)
+        )
+        
+        # Additional instructions
+        additional_instructions = st.text_area(
+            "Additional Instructions (optional)",
+            placeholder="Add any specific requirements or instructions for the report...",
+            height=100
+        )
+        
+        generate_custom_report = st.form_submit_button("Generate Custom Report")
     
     # Generate the report
-    if st.button("Generate Custom Report") and input_content:
+    if generate_custom_report and input_content:
         with st.status("Generating custom report..."):
             # Prepare system prompt based on report format
-            if report_format == "Standard Report":
-                system_prompt = "You are a professional report writer tasked with creating a clear and well-structured report."
-            elif report_format == "Bulleted Summary":
-                system_prompt = "You are a professional summarizer tasked with creating a concise, bullet-point summary of information."
-            elif report_format == "FAQ Style":
-                system_prompt = "You are a knowledge base manager tasked with organizing information into a FAQ format with questions and detailed answers."
-            elif report_format == "Technical Documentation":
-                system_prompt = "You are a technical writer tasked with creating clear, precise documentation with appropriate technical details and explanations."
-            elif report_format == "Newsletter":
-                system_prompt = "You are a newsletter editor tasked with creating an engaging newsletter with key information and highlights."
-            else:  # Academic Paper
-                system_prompt = "You are an academic researcher tasked with organizing information into a formal academic paper structure."
+            system_prompt = CUSTOM_REPORT_PROMPTS[report_format]
             
             # Create a prompt for the report
-            prompt = f"""
-            Create a {report_format} titled "{report_title}" based on the following information.
-            
-            {additional_instructions if additional_instructions else ""}
-            
-            Format the report in Markdown with appropriate headings, sections, and formatting.
-            """
+            prompt = CUSTOM_REPORT_TEMPLATE.format(
+                report_format=report_format,
+                report_title=report_title,
+                additional_instructions=additional_instructions or ""
+            )
             
             # Get response from Mistral
             try:
-                response = client.chat.complete(
-                    model=config["model"],
-                    messages=[
+                # Display the report as it is generated
+                st.subheader(report_title)
+                report_content = stream_completion(
+                    [
                         {"role": "system", "content": system_prompt},
                         {"role": "user", "content": prompt + "\n\nINFORMATION:\n" + input_content}
                     ],
@@ -468,22 +615,17 @@ with tab3:
                     max_tokens=3000
                 )
                 
-                report_content = response.choices[0].message.content
-                
-                # Display the report
-                st.subheader(report_title)
-                st.markdown(report_content)
-                
                 # Provide download option
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                timestamp = next_report_stamp()
                 report_filename = f"{report_title.lower().replace(' ', '_')}_{timestamp}.md"
                 
                 st.download_button(
                     label="Download Report",
-                    data=report_content,
+                    data=report_content.encode("utf-8"),
                     file_name=report_filename,
-                    mime="text/markdown"
+                    mime="text/markdown; charset=utf-8"
                 )
+                remember_report("last_report_custom", report_title, report_content, report_filename)
                 
             except Exception as e:
                 st.error(f"Error generating report: {str(e)}")
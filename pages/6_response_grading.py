@@ -4,15 +4,21 @@ import sys
 import json
 from pathlib import Path
 import time
+import bisect
 
 # Add the parent directory to the path so we can import the helper modules
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
 # Check if the response_grader module is available
 try:
     from response_grader import (
-        grade_response, 
+        grade_responses, 
+        grade_response_stream, 
+        submit_grading_batch, 
+        refresh_batch_jobs, 
+        load_batch_results, 
         create_grading_criteria, 
         load_grading_templates, 
         save_grading_template,
@@ -23,7 +29,7 @@ except ImportError:
     has_grader = False
     st.error("Response grading module not found. Make sure response_grader.py is in the main directory.")
 
-from helper_functions import setup_logging, load_config
+from helper_functions import setup_logging, load_config, file_mtime
 
 # Setup
 logger = setup_logging()
@@ -36,25 +42,122 @@ st.set_page_config(
     layout="wide",
 )
 
-# Initialize Mistral client
-@st.cache_resource
-def check_api_key():
+# Check the API key once every few minutes rather than on every rerun
+@st.cache_data(ttl=300)
+def _api_status():
     api_key = os.environ.get("MISTRAL_API_KEY", "")
-    if not api_key:
-        st.error("Missing API key. Please set your Mistral API Key on the Home page.")
-        return False
-    return True
+    return (bool(api_key), "" if api_key else "Missing API key. Please set your Mistral API Key on the Home page.")
 
 # Check if the API key is available
-if not check_api_key():
+api_ok, api_message = _api_status()
+if not api_ok:
+    # A missing key is not kept cached, so setting it on the Home page takes effect on the next rerun
+    _api_status.clear()
+    st.error(api_message)
     st.stop()
 
 if not has_grader:
     st.error("The Response Grading feature requires the response_grader.py module. Make sure it exists in your main directory.")
     st.stop()
 
-# Templates
-templates = load_grading_templates()
+# Templates are re-read only when the templates directory changes; cleared after every save or delete
+@st.cache_data(show_spinner=False)
+def _cached_templates(mtime):
+    return load_grading_templates()
+
+templates = _cached_templates(file_mtime("grading_templates"))
+
+# Default criteria depend only on subject and difficulty, so build each combination once
+@st.cache_data(show_spinner=False)
+def cached_grading_criteria(subject, difficulty):
+    return create_grading_criteria(subject, difficulty)
+
+# Line that separates several responses pasted into one response box
+RESPONSE_SEPARATOR = "\n---\n"
+
+def split_responses(text):
+    """Split the response box into individual responses on lines containing only ---"""
+    return [response.strip() for response in text.split(RESPONSE_SEPARATOR) if response.strip()]
+
+# Longer responses and reference answers are cut to this many characters before grading to cap prompt size
+MAX_INPUT_CHARS = config.get("max_input_chars", 8000)
+
+def cap_input(text, label):
+    """Cut text to MAX_INPUT_CHARS, warning when it is truncated"""
+    if text and len(text) > MAX_INPUT_CHARS:
+        st.warning(f"{label} truncated to {MAX_INPUT_CHARS} characters for grading.")
+        return text[:MAX_INPUT_CHARS]
+    return text
+
+# Scores from 6 are shown orange and from 8 green
+SCORE_COLOR_THRESHOLDS = [6, 8]
+SCORE_COLORS = ("red", "orange", "green")
+
+# Result lists shown under each heading, with the marker put before every item
+RESULT_SECTIONS = (
+    ("strengths", "Strengths", "✅"),
+    ("weaknesses", "Areas for Improvement", "⚠️"),
+    ("suggestions", "Suggestions", "💡"),
+)
+
+def render_grading_result(grading_result):
+    """Display the score, feedback, strengths, weaknesses and suggestions of a grading result"""
+    # Display score; a streamed partial result may not have one yet
+    score = grading_result.get("score")
+    if isinstance(score, (int, float)):
+        score_color = SCORE_COLORS[bisect.bisect_right(SCORE_COLOR_THRESHOLDS, score)]
+        st.markdown(f"## Score: <span style='color:{score_color};'>{score}/10</span>", unsafe_allow_html=True)
+    
+    # Display feedback
+    if "feedback" in grading_result:
+        st.markdown(f"**Overall Assessment:** {grading_result['feedback']}")
+    
+    # Display each list as a single markdown block
+    for field, heading, marker in RESULT_SECTIONS:
+        items = grading_result.get(field)
+        if items:
+            st.markdown(f"### {heading}\n\n" + "\n\n".join(f"{marker} {item}" for item in items))
+
+def stream_grading_result(user_response, context, criteria, reference_answer, prompt_template=None):
+    """Grade a single response, redrawing the result as each field streams in; returns the final result"""
+    placeholder = st.empty()
+    grading_result = None
+    for grading_result in grade_response_stream(
+        user_response,
+        context=context,
+        criteria=criteria,
+        reference_answer=reference_answer,
+        client=get_mistral_client(),
+        prompt_template=prompt_template
+    ):
+        with placeholder.container():
+            render_grading_result(grading_result)
+    return grading_result
+
+def render_grading_results(grading_results):
+    """Display one or more grading results, numbering them when there are several"""
+    for number, grading_result in enumerate(grading_results, 1):
+        if len(grading_results) > 1:
+            st.subheader(f"Response {number}")
+        render_grading_result(grading_result)
+
+# Batch job statuses are re-checked on the polling interval from the settings page
+@st.fragment(run_every=config.get("batch_poll_interval", 60))
+def render_batch_jobs():
+    """List queued batch grading jobs, refreshing unfinished ones and showing finished results"""
+    # One read, and at most one write, of the jobs file per poll
+    jobs = refresh_batch_jobs()
+    if not jobs:
+        st.info("No batch grading jobs. Queue responses from the Advanced Grading tab.")
+        return
+    
+    for job_id in sorted(jobs, key=lambda job_id: jobs[job_id]["submitted"], reverse=True):
+        record = jobs[job_id]
+        st.markdown(f"**{job_id}** — {record['count']} responses, submitted {record['submitted']}: {record['status']}")
+        
+        if record.get("results_file") and st.checkbox("Show results", key=f"batch_results_{job_id}"):
+            results = load_batch_results(job_id) or []
+            render_grading_results([result or {"score": 0, "feedback": "No result returned for this response."} for result in results])
 
 # Sidebar
 with st.sidebar:
@@ -73,6 +176,15 @@ with st.sidebar:
         st.info("No saved templates found.")
         selected_template = "None"
     
+    # Several responses separated by --- are graded together, this many per API call
+    grading_batch_size = st.slider(
+        "Responses per API call",
+        min_value=1,
+        max_value=10,
+        value=5,
+        help="When several responses are separated by a line containing only ---, they are graded in batches of this size"
+    )
+    
     # Link back to chat
     st.markdown("---")
     st.markdown("[Back to Chat](/Chat)", unsafe_allow_html=True)
@@ -80,11 +192,17 @@ with st.sidebar:
 # Main content
 st.title("Response Grading")
 
-# Create tabs for different grading functions
-tab1, tab2, tab3 = st.tabs(["Simple Grading", "Advanced Grading", "Manage Templates"])
+# Choose a grading function; unlike st.tabs, only the selected section builds its widgets on each rerun
+active_tab = st.radio(
+    "Mode",
+    ["Simple Grading", "Advanced Grading", "Manage Templates"],
+    horizontal=True,
+    key="active_tab",
+    label_visibility="collapsed"
+)
 
 # Tab 1: Simple Grading
-with tab1:
+if active_tab == "Simple Grading":
     st.header("Simple Response Grading")
     st.markdown("Grade a response quickly without complex settings.")
     
@@ -97,8 +215,9 @@ with tab1:
     # User response
     user_response = st.text_area("User Response to Grade", 
                                 height=200,
-                                placeholder="Enter the user's response to be graded...",
+                                placeholder="Enter the user's response to be graded. Separate several responses with a line containing only ---",
                                 key="simple_response")  # Added unique key
+    responses = [cap_input(response, f"Response {number}") for number, response in enumerate(split_responses(user_response), 1)]
     
     # Subject selection for appropriate criteria
     subject_options = ["General", "Math", "Science", "History", "English", "Programming"]
@@ -113,7 +232,7 @@ with tab1:
     )
     
     # Grade button
-    if st.button("Grade Response", key="simple_grade") and user_response:
+    if st.button("Grade Response", key="simple_grade") and responses:
         with st.status("Grading response..."):
             # Use the selected template if available
             if selected_template != "None":
@@ -121,62 +240,33 @@ with tab1:
                 criteria = template.get("criteria")
                 reference_answer = template.get("reference_answer")
                 context = template.get("context") or question
+                # The template's compiled prompt only matches when the template supplies its own question
+                prompt_template = template.get("prompt_template") if template.get("context") else None
             else:
                 # Create criteria based on subject and difficulty
-                criteria = create_grading_criteria(
-                    subject=subject, 
-                    difficulty=difficulty.lower()
-                )
+                criteria = cached_grading_criteria(subject, difficulty.lower())
                 reference_answer = None
                 context = question
+                prompt_template = None
             
-            # Grade the response
-            client = get_mistral_client()
-            grading_result = grade_response(
-                user_response=user_response,
-                context=context,
-                criteria=criteria,
-                reference_answer=reference_answer,
-                client=client
-            )
+            if len(responses) == 1:
+                # Stream a single response so the score shows as soon as the model writes it
+                grading_result = stream_grading_result(responses[0], context, criteria, reference_answer, prompt_template)
+                grading_results = [grading_result] if grading_result else None
+            else:
+                # Grade the responses, batching several into each API call
+                grading_results = grade_responses(
+                    responses,
+                    context=context,
+                    criteria=criteria,
+                    reference_answer=reference_answer,
+                    client=get_mistral_client(),
+                    batch_size=grading_batch_size
+                )
+                if grading_results:
+                    render_grading_results(grading_results)
             
-            if grading_result:
-                # Display score
-                score = grading_result.get("score", 0)
-                feedback = grading_result.get("feedback", "")
-                
-                # Calculate score color
-                if score >= 8:
-                    score_color = "green"
-                elif score >= 6:
-                    score_color = "orange"
-                else:
-                    score_color = "red"
-                
-                # Display score and feedback
-                st.markdown(f"## Score: <span style='color:{score_color};'>{score}/10</span>", unsafe_allow_html=True)
-                st.markdown(f"**Overall Assessment:** {feedback}")
-                
-                # Display strengths
-                strengths = grading_result.get("strengths", [])
-                if strengths:
-                    st.markdown("### Strengths")
-                    for strength in strengths:
-                        st.markdown(f"✅ {strength}")
-                
-                # Display weaknesses
-                weaknesses = grading_result.get("weaknesses", [])
-                if weaknesses:
-                    st.markdown("### Areas for Improvement")
-                    for weakness in weaknesses:
-                        st.markdown(f"⚠️ {weakness}")
-                
-                # Display suggestions
-                suggestions = grading_result.get("suggestions", [])
-                if suggestions:
-                    st.markdown("### Suggestions")
-                    for suggestion in suggestions:
-                        st.markdown(f"💡 {suggestion}")
+            if grading_results:
                 
                 # Save as template option
                 st.divider()
@@ -193,15 +283,15 @@ with tab1:
                         )
                         if success:
                             st.success(f"Template '{template_name}' saved successfully!")
-                            # Refresh templates
-                            templates = load_grading_templates()
+                            # Templates are reloaded on the next rerun
+                            _cached_templates.clear()
                         else:
                             st.error("Error saving template.")
             else:
                 st.error("Error grading response. Please try again.")
 
 # Tab 2: Advanced Grading
-with tab2:
+elif active_tab == "Advanced Grading":
     st.header("Advanced Response Grading")
     st.markdown("Customize your grading criteria, set reference answers, and more.")
     
@@ -233,8 +323,10 @@ with tab2:
     # User response
     user_response = st.text_area("User Response to Grade", 
                                 height=200,
-                                placeholder="Enter the user's response to be graded...",
+                                placeholder="Enter the user's response to be graded. Separate several responses with a line containing only ---",
                                 key="advanced_response")  # Added unique key
+    responses = [cap_input(response, f"Response {number}") for number, response in enumerate(split_responses(user_response), 1)]
+    reference_answer = cap_input(reference_answer, "Reference answer")
     
     # Custom criteria
     st.subheader("Grading Criteria")
@@ -250,37 +342,44 @@ with tab2:
             "analysis": "Depth of analysis and critical thinking"
         }
     
-    # Display existing criteria
-    criteria_list = []
-    for criterion, description in criteria.items():
-        criteria_list.append({"name": criterion, "description": description})
+    # Criteria rows live in session state so added rows survive reruns; they reset when the template changes
+    if st.session_state.get("adv_criteria_template") != selected_template:
+        st.session_state.adv_criteria_template = selected_template
+        st.session_state.adv_criteria_list = [
+            {"name": criterion, "description": description} for criterion, description in criteria.items()
+        ]
+    criteria_list = st.session_state.adv_criteria_list
     
     # Allow editing of criteria
     updated_criteria = {}
     st.markdown("Edit existing criteria or add new ones")
     
-    # Custom criteria editor
-    for i, criterion in enumerate(criteria_list):
-        col1, col2, col3 = st.columns([3, 6, 1])
-        with col1:
-            criterion_name = st.text_input(f"Criterion {i+1} Name", 
-                                           value=criterion["name"],
-                                           key=f"criterion_name_{i}")
-        with col2:
-            criterion_desc = st.text_input(f"Description", 
-                                           value=criterion["description"],
-                                           key=f"criterion_desc_{i}")
-        with col3:
-            st.write("")
-            st.write("")
-            remove = st.checkbox("Remove", key=f"remove_{i}")
+    # Custom criteria editor; edits are applied together instead of rerunning the page on each keystroke
+    with st.form("adv_criteria"):
+        for i, criterion in enumerate(criteria_list):
+            col1, col2, col3 = st.columns([3, 6, 1])
+            with col1:
+                criterion_name = st.text_input(f"Criterion {i+1} Name", 
+                                               value=criterion["name"],
+                                               key=f"criterion_name_{i}")
+            with col2:
+                criterion_desc = st.text_input(f"Description", 
+                                               value=criterion["description"],
+                                               key=f"criterion_desc_{i}")
+            with col3:
+                st.write("")
+                st.write("")
+                remove = st.checkbox("Remove", key=f"remove_{i}")
+            
+            if not remove and criterion_name:
+                updated_criteria[criterion_name] = criterion_desc
         
-        if not remove and criterion_name:
-            updated_criteria[criterion_name] = criterion_desc
+        st.form_submit_button("Apply Criteria")
     
     # Add new criterion button
     if st.button("Add New Criterion", key="add_criterion"):  # Added unique key
         criteria_list.append({"name": "", "description": ""})
+        st.rerun()
     
     # Grading settings
     st.subheader("Grading Settings")
@@ -304,64 +403,49 @@ with tab2:
             key="advanced_feedback_detail"  # Added unique key
         )
     
+    # Add sensitivity and detail to the criteria
+    grading_context = f"""
+    Question: {question}
+    
+    Grading Sensitivity: {sensitivity}
+    Feedback Detail: {feedback_detail}
+    """
+    
+    # Queue responses for out-of-band grading through the Batch API instead of grading them now
+    if st.button("Queue for Batch Grading", key="advanced_queue_batch", help="Grade through the Mistral Batch API at a lower cost; results appear under Manage Templates") and responses:
+        job_id = submit_grading_batch(
+            responses,
+            context=grading_context,
+            criteria=updated_criteria,
+            reference_answer=reference_answer,
+            client=get_mistral_client()
+        )
+        if job_id:
+            st.success(f"Batch grading job {job_id} queued. Check its progress under Batch Grading Jobs in the Manage Templates tab.")
+        else:
+            st.error("Error queueing batch grading job.")
+    
     # Grade button
-    if st.button("Grade Response", key="advanced_grade") and user_response:
+    if st.button("Grade Response", key="advanced_grade") and responses:
         with st.status("Grading response..."):
-            # Add sensitivity and detail to the criteria
-            grading_context = f"""
-            Question: {question}
-            
-            Grading Sensitivity: {sensitivity}
-            Feedback Detail: {feedback_detail}
-            """
-            
-            # Grade the response
-            client = get_mistral_client()
-            grading_result = grade_response(
-                user_response=user_response,
-                context=grading_context,
-                criteria=updated_criteria,
-                reference_answer=reference_answer,
-                client=client
-            )
+            if len(responses) == 1:
+                # Stream a single response so the score shows as soon as the model writes it
+                grading_result = stream_grading_result(responses[0], grading_context, updated_criteria, reference_answer)
+                grading_results = [grading_result] if grading_result else None
+            else:
+                # Grade the responses, batching several into each API call
+                grading_results = grade_responses(
+                    responses,
+                    context=grading_context,
+                    criteria=updated_criteria,
+                    reference_answer=reference_answer,
+                    client=get_mistral_client(),
+                    batch_size=grading_batch_size
+                )
+                if grading_results:
+                    render_grading_results(grading_results)
             
-            if grading_result:
-                # Display score
-                score = grading_result.get("score", 0)
-                feedback = grading_result.get("feedback", "")
-                
-                # Calculate score color
-                if score >= 8:
-                    score_color = "green"
-                elif score >= 6:
-                    score_color = "orange"
-                else:
-                    score_color = "red"
-                
-                # Display score and feedback
-                st.markdown(f"## Score: <span style='color:{score_color};'>{score}/10</span>", unsafe_allow_html=True)
-                st.markdown(f"**Overall Assessment:** {feedback}")
-                
-                # Display strengths
-                strengths = grading_result.get("strengths", [])
-                if strengths:
-                    st.markdown("### Strengths")
-                    for strength in strengths:
-                        st.markdown(f"✅ {strength}")
-                
-                # Display weaknesses
-                weaknesses = grading_result.get("weaknesses", [])
-                if weaknesses:
-                    st.markdown("### Areas for Improvement")
-                    for weakness in weaknesses:
-                        st.markdown(f"⚠️ {weakness}")
-                
-                # Display suggestions
-                suggestions = grading_result.get("suggestions", [])
-                if suggestions:
-                    st.markdown("### Suggestions")
-                    for suggestion in suggestions:
-                        st.markdown(f"💡 {suggestion}")
+            if grading_results:
                 
                 # Save as template option
                 st.divider()
@@ -378,15 +462,15 @@ with tab2:
                         )
                         if success:
                             st.success(f"Template '{template_name}' saved successfully!")
-                            # Refresh templates
-                            templates = load_grading_templates()
+                            # Templates are reloaded on the next rerun
+                            _cached_templates.clear()
                         else:
                             st.error("Error saving template.")
             else:
                 st.error("Error grading response. Please try again.")
 
 # Tab 3: Manage Templates
-with tab3:
+else:
     st.header("Manage Grading Templates")
     
     # Display and manage templates
@@ -416,65 +500,71 @@ with tab3:
                         try:
                             os.remove(template_path)
                             st.success(f"Template '{template_name}' deleted successfully!")
-                            # Refresh templates
-                            templates = load_grading_templates()
-                            st.experimental_rerun()
+                            # Templates are reloaded by the rerun
+                            _cached_templates.clear()
+                            st.rerun()
                         except Exception as e:
                             st.error(f"Error deleting template: {str(e)}")
     else:
         st.info("No saved templates found. Create a template by grading a response and saving it.")
     
+    # Batch grading jobs
+    st.subheader("Batch Grading Jobs")
+    render_batch_jobs()
+    
     # Create new template from scratch
     st.subheader("Create New Template")
     
     with st.expander("Create Template"):
-        new_template_name = st.text_input("Template Name", value="New_Template", key="new_template_name")  # Added unique key
-        new_template_context = st.text_area("Context/Question", height=100, key="new_template_context")  # Added unique key
-        new_template_reference = st.text_area("Reference Answer (Optional)", height=150, key="new_template_reference")  # Added unique key
-        
-        st.markdown("**Criteria**")
-        new_criteria = {}
-        
-        # Default criteria
-        default_criteria = create_grading_criteria("general", "medium")
-        
-        # Display criteria editor
-        for i, (criterion, description) in enumerate(default_criteria.items()):
-            col1, col2, col3 = st.columns([3, 6, 1])
-            with col1:
-                criterion_name = st.text_input(f"Criterion {i+1} Name", 
-                                              value=criterion,
-                                              key=f"new_criterion_name_{i}")
-            with col2:
-                criterion_desc = st.text_input(f"Description", 
-                                              value=description,
-                                              key=f"new_criterion_desc_{i}")
-            with col3:
-                st.write("")
-                st.write("")
-                remove = st.checkbox("Remove", key=f"new_remove_{i}")
+        # Nothing reruns until the template is saved, however many criteria are edited
+        with st.form("new_template_form"):
+            new_template_name = st.text_input("Template Name", value="New_Template", key="new_template_name")  # Added unique key
+            new_template_context = st.text_area("Context/Question", height=100, key="new_template_context")  # Added unique key
+            new_template_reference = st.text_area("Reference Answer (Optional)", height=150, key="new_template_reference")  # Added unique key
             
-            if not remove and criterion_name:
-                new_criteria[criterion_name] = criterion_desc
-        
-        # Save button
-        if st.button("Save New Template", key="save_new_template"):  # Added unique key
-            if new_template_name:
-                success = save_grading_template(
-                    template_name=new_template_name,
-                    criteria=new_criteria,
-                    reference_answer=new_template_reference,
-                    context=new_template_context
-                )
-                if success:
-                    st.success(f"Template '{new_template_name}' created successfully!")
-                    # Refresh templates
-                    templates = load_grading_templates()
-                    st.experimental_rerun()
+            st.markdown("**Criteria**")
+            new_criteria = {}
+            
+            # Default criteria
+            default_criteria = cached_grading_criteria("general", "medium")
+            
+            # Display criteria editor
+            for i, (criterion, description) in enumerate(default_criteria.items()):
+                col1, col2, col3 = st.columns([3, 6, 1])
+                with col1:
+                    criterion_name = st.text_input(f"Criterion {i+1} Name", 
+                                                  value=criterion,
+                                                  key=f"new_criterion_name_{i}")
+                with col2:
+                    criterion_desc = st.text_input(f"Description", 
+                                                  value=description,
+                                                  key=f"new_criterion_desc_{i}")
+                with col3:
+                    st.write("")
+                    st.write("")
+                    remove = st.checkbox("Remove", key=f"new_remove_{i}")
+            
+                if not remove and criterion_name:
+                    new_criteria[criterion_name] = criterion_desc
+            
+            # Save button
+            if st.form_submit_button("Save New Template"):
+                if new_template_name:
+                    success = save_grading_template(
+                        template_name=new_template_name,
+                        criteria=new_criteria,
+                        reference_answer=new_template_reference,
+                        context=new_template_context
+                    )
+                    if success:
+                        st.success(f"Template '{new_template_name}' created successfully!")
+                        # Templates are reloaded by the rerun
+                        _cached_templates.clear()
+                        st.rerun()
+                    else:
+                        st.error("Error creating template.")
                 else:
-                    st.error("Error creating template.")
-            else:
-                st.error("Please provide a template name.")
+                    st.error("Please provide a template name.")
 
 # Add helpful information
 st.markdown("---")
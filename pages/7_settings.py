@@ -1,14 +1,14 @@
 import os
 import streamlit as st
-import json
 from pathlib import Path
 import sys
 
 # Add the parent directory to the path so we can import the helper modules
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(parent_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
-from helper_functions import load_config
+from helper_functions import file_mtime, cached_config, json_loads, json_dumps
 
 # Page configuration
 st.set_page_config(
@@ -30,8 +30,9 @@ def check_api_key():
 if not check_api_key():
     st.stop()
 
+# Config is re-read only when config.json changes; cleared after every write below
 # Load current configuration
-config = load_config()
+config = cached_config(file_mtime("config.json"))
 
 # Sidebar
 with st.sidebar:
@@ -142,6 +143,65 @@ with tab3:
             step=10,
             help="Overlap between document chunks"
         )
+    
+    # Response grading settings
+    st.subheader("Response Grading")
+    
+    grading_model_options = ["mistral-small-latest", "mistral-medium-latest", "mistral-large-latest"]
+    current_grading_model = config.get("grading_model", "mistral-small-latest")
+    # Keep a model set by hand or by imported settings selectable, so saving does not replace it
+    if current_grading_model not in grading_model_options:
+        grading_model_options.append(current_grading_model)
+    grading_model = st.selectbox(
+        "Grading Model",
+        options=grading_model_options,
+        index=grading_model_options.index(current_grading_model),
+        help="Model used to grade responses; results with no score or feedback are re-graded with the default model"
+    )
+    
+    max_input_chars = st.number_input(
+        "Maximum Characters per Graded Input",
+        min_value=500,
+        max_value=100000,
+        value=config.get("max_input_chars", 8000),
+        step=500,
+        help="Longer responses and reference answers are truncated before grading to cap prompt size and cost"
+    )
+    
+    batch_poll_interval = st.number_input(
+        "Batch Job Polling Interval (seconds)",
+        min_value=10,
+        max_value=3600,
+        value=config.get("batch_poll_interval", 60),
+        step=10,
+        help="How often the Response Grading page checks the status of queued batch grading jobs"
+    )
+    
+    grading_concurrency = st.slider(
+        "Grading Concurrency",
+        min_value=1,
+        max_value=32,
+        value=config.get("grading_concurrency", 8),
+        help="Maximum number of grading requests sent to the API at the same time; keep it below your rate limit"
+    )
+    
+    local_prescoring = st.checkbox(
+        "Score obvious matches locally",
+        value=config.get("local_prescoring", False),
+        help="Responses that almost exactly match, or share almost nothing with, a reference answer of 20 or more words are scored without calling the API; word overlap ignores meaning, so a paraphrase or an added \"not\" can be misgraded"
+    )
+    
+    semantic_grade_cache = st.checkbox(
+        "Reuse grades of near-duplicate responses",
+        value=config.get("semantic_grade_cache", False),
+        help="Responses whose embedding is almost identical to an already graded one, under the same grading prompt, reuse its grade; costs one embedding call per uncached response"
+    )
+    
+    if st.button("Clear Grading Cache", help="Identical grading requests are answered from a disk cache for a day; clear it to grade them again"):
+        # Import only if needed
+        from response_grader import clear_grade_cache, GRADE_CACHE_STATS
+        st.success(f"Removed {clear_grade_cache()} cached grading results.")
+        st.caption(f"Since the app started: {GRADE_CACHE_STATS['hits']} cache hits, {GRADE_CACHE_STATS['misses']} misses.")
 
 # Save settings button
 if st.button("Save Settings"):
@@ -155,14 +215,21 @@ if st.button("Save Settings"):
         "embedding_model": embedding_model,
         "system_prompt": system_prompt,
         "chunk_size": chunk_size,
-        "chunk_overlap": chunk_overlap
+        "chunk_overlap": chunk_overlap,
+        "batch_poll_interval": batch_poll_interval,
+        "grading_concurrency": grading_concurrency,
+        "local_prescoring": local_prescoring,
+        "semantic_grade_cache": semantic_grade_cache,
+        "max_input_chars": max_input_chars,
+        "grading_model": grading_model
     }
     
     # Write to config file
     config_path = Path("config.json")
     try:
-        with open(config_path, "w") as f:
-            json.dump(updated_config, f, indent=4)
+        with open(config_path, "wb") as f:
+            f.write(json_dumps(updated_config))
+        cached_config.clear()
         
         st.success("Settings saved successfully!")
     except Exception as e:
@@ -179,14 +246,21 @@ if st.button("Reset to Defaults"):
         "embedding_model": "mistral-embed",
         "system_prompt": "You are a helpful assistant that provides accurate and concise information.",
         "chunk_size": 500,
-        "chunk_overlap": 100
+        "chunk_overlap": 100,
+        "batch_poll_interval": 60,
+        "grading_concurrency": 8,
+        "local_prescoring": False,
+        "semantic_grade_cache": False,
+        "max_input_chars": 8000,
+        "grading_model": "mistral-small-latest"
     }
     
     # Write default config to file
     config_path = Path("config.json")
     try:
-        with open(config_path, "w") as f:
-            json.dump(default_config, f, indent=4)
+        with open(config_path, "wb") as f:
+            f.write(json_dumps(default_config))
+        cached_config.clear()
         
         st.success("Settings reset to defaults! Refresh the page to see changes.")
     except Exception as e:
@@ -201,7 +275,7 @@ col1, col2 = st.columns(2)
 with col1:
     if st.button("Export Settings"):
         # Convert config to JSON string
-        config_json = json.dumps(config, indent=4)
+        config_json = json_dumps(config)
         
         # Create download button
         st.download_button(
@@ -217,7 +291,7 @@ with col2:
     if uploaded_config and st.button("Apply Imported Settings"):
         try:
             # Read and parse the uploaded JSON
-            imported_config = json.loads(uploaded_config.getvalue().decode("utf-8"))
+            imported_config = json_loads(uploaded_config.getvalue())
             
             # Validate the imported config (basic check)
             required_keys = ["model", "temperature", "max_tokens"]
@@ -225,8 +299,9 @@ with col2:
             if all(key in imported_config for key in required_keys):
                 # Write to config file
                 config_path = Path("config.json")
-                with open(config_path, "w") as f:
-                    json.dump(imported_config, f, indent=4)
+                with open(config_path, "wb") as f:
+                    f.write(json_dumps(imported_config))
+                cached_config.clear()
                 
                 st.success("Imported settings applied successfully! Refresh the page to see changes.")
             else:
@@ -1,22 +1,551 @@
 import os
 import logging
 import json
+import datetime
+import time
+import string
+import re
+import threading
+from collections import Counter, OrderedDict
+from types import MappingProxyType
+import hashlib
+import functools
+import io
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from mistralai import Mistral
 from pathlib import Path
-from helper_functions import load_config
+from helper_functions import load_config, json_loads, json_dumps
 
 # Initialize logger
 logger = logging.getLogger("chatbot.response_grader")
 
+# Keep-alive connections shared by concurrent grading requests
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_KEEPALIVE_EXPIRY = 60
+
+@functools.lru_cache(maxsize=1)
+def _client_for_key(api_key):
+    # Import only if needed; httpx is installed with mistralai, and h2 enables HTTP/2 when present
+    try:
+        import httpx
+    except ImportError:
+        return Mistral(api_key=api_key)
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    
+    http_client = httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    return Mistral(api_key=api_key, client=http_client)
+
 def get_mistral_client():
-    """Get Mistral client instance"""
+    """Get the Mistral client for the current API key, reusing it (and its connections) across calls"""
     api_key = os.environ.get("MISTRAL_API_KEY", "")
     if not api_key:
         logger.error("Missing API key")
         return None
-    return Mistral(api_key=api_key)
+    return _client_for_key(api_key)
+
+@functools.lru_cache(maxsize=1)
+def _config_for_mtime(mtime):
+    return load_config()
+
+def _current_config():
+    """Load the config, re-reading config.json only when it has changed"""
+    try:
+        mtime = os.path.getmtime("config.json")
+    except OSError:
+        mtime = None
+    return _config_for_mtime(mtime)
+
+# Fields every grading result has, with their empty values
+RESULT_FIELDS = {
+    "score": "",
+    "feedback": "",
+    "strengths": [],
+    "weaknesses": [],
+    "suggestions": []
+}
+
+# JSON structure the model is asked to return for each graded response, kept compact to save output tokens
+RESULT_FORMAT = '{"score":number 1-10,"feedback":str,"strengths":[str],"weaknesses":[str],"suggestions":[str]}'
+
+# Output token limit per graded response; minified JSON needs far less than free-form text
+GRADING_MAX_TOKENS = 400
+
+def _empty_response_result():
+    return {
+        "score": 0,
+        "feedback": "No response provided.",
+        "strengths": [],
+        "weaknesses": [],
+        "suggestions": []
+    }
+
+def _error_result(feedback, raw_response=None):
+    result = {
+        "score": 0,
+        "feedback": feedback,
+        "strengths": [],
+        "weaknesses": [],
+        "suggestions": [],
+        # Marks results that report a failure rather than a grade, so they are never cached
+        "error": True
+    }
+    if raw_response is not None:
+        result["raw_response"] = raw_response
+    return result
+
+# Fixed prompt text, built once at import rather than on every grading call
+_PROMPT_HEADER = """
+    You are an expert evaluator tasked with grading a user's response objectively and providing constructive feedback.
+    
+    """
+
+DEFAULT_GRADING_CRITERIA = {
+    "accuracy": "Correctness of the information and concepts",
+    "completeness": "Coverage of all relevant points",
+    "clarity": "Clear explanation and logical structure",
+    "depth": "Depth of understanding and insight"
+}
+
+_DEFAULT_CRITERIA_BLOCK = "GRADING CRITERIA:\n" + "".join(
+    f"- {criterion.capitalize()}: {description}\n" for criterion, description in DEFAULT_GRADING_CRITERIA.items()
+)
+
+_GRADING_STEPS = "Score 1-10; feedback: 1-2 sentence overall assessment; 2-3 strengths; 2-3 weaknesses (areas for improvement); 1-2 specific suggestions."
+
+_PROMPT_INSTRUCTIONS_JSON = f"""
+    INSTRUCTIONS:
+    {_GRADING_STEPS}
+    Output one-line minified JSON only, no code fences, no leading or trailing text. Schema: {RESULT_FORMAT}
+    """
+
+# Placeholder for the response followed by the instructions, escaped for string.Template
+_SINGLE_RESPONSE_TAIL = """
+    USER'S RESPONSE TO EVALUATE:
+    $user_response
+    """ + _PROMPT_INSTRUCTIONS_JSON.replace("$", "$$")
+
+# Batched instructions; only the response count is filled in per batch
+_BATCH_INSTRUCTIONS_JSON = f"""
+    INSTRUCTIONS:
+    Evaluate each response independently. For each one: {_GRADING_STEPS}
+    Output a one-line minified JSON array of exactly {{count}} objects, one per response in the order given, no code fences, no leading or trailing text. Object schema: {RESULT_FORMAT.replace("{", "{{").replace("}", "}}")}
+    """
+
+@functools.lru_cache(maxsize=128)
+def _render_criteria(items, named):
+    """Render criteria as prompt lines; items are (name, description) pairs when named, else plain criteria"""
+    if named:
+        lines = [f"- {criterion.capitalize()}: {description}\n" for criterion, description in items]
+    else:
+        lines = [f"- {criterion}\n" for criterion in items]
+    return "GRADING CRITERIA:\n" + "".join(lines)
+
+def _render_cached(items, named):
+    try:
+        return _render_criteria(items, named)
+    except TypeError:
+        # Unhashable criteria cannot be cached
+        return _render_criteria.__wrapped__(items, named)
+
+def _render_dict_criteria(criteria):
+    return _render_cached(tuple(criteria.items()), True)
+
+def _render_list_criteria(criteria):
+    return _render_cached(tuple(criteria), False)
+
+def _render_default_criteria(criteria):
+    return _DEFAULT_CRITERIA_BLOCK
+
+# Criteria block renderer for each supported criteria type; anything else, or empty criteria, gets the defaults
+_CRITERIA_RENDERERS = {
+    dict: _render_dict_criteria,
+    OrderedDict: _render_dict_criteria,
+    list: _render_list_criteria,
+}
 
-def grade_response(user_response, context=None, criteria=None, reference_answer=None, client=None):
+def _criteria_renderer(criteria):
+    """Pick the renderer for the criteria type, falling back to isinstance for subclasses such as defaultdict"""
+    if not criteria:
+        return _render_default_criteria
+    renderer = _CRITERIA_RENDERERS.get(type(criteria))
+    if renderer is None:
+        renderer = next((renderer for criteria_type, renderer in _CRITERIA_RENDERERS.items() if isinstance(criteria, criteria_type)), _render_default_criteria)
+    return renderer
+
+def _build_grading_preamble(context, criteria, reference_answer):
+    """Build the part of the grading prompt shared by single and batched grading"""
+    parts = [_PROMPT_HEADER]
+    
+    # Add context if provided
+    if context:
+        parts.append(f"""
+        CONTEXT/QUESTION:
+        {context}
+        
+        """)
+    
+    # Add reference answer if provided
+    if reference_answer:
+        parts.append(f"""
+        REFERENCE ANSWER (for comparison):
+        {reference_answer}
+        
+        """)
+    
+    # Add criteria for evaluation; the default criteria are rendered once at import
+    parts.append(_criteria_renderer(criteria)(criteria))
+    
+    return "".join(parts)
+
+# Markdown code fence opening or closing a JSON reply
+_FENCE_RE = re.compile(r"^\s*```(?:json)?|```\s*$")
+
+def _strip_code_fence(result_text):
+    """Remove any markdown code block indicators around a JSON reply"""
+    return _FENCE_RE.sub("", result_text).strip()
+
+# A score given as a string, such as "7" or " 8.5 "
+_SCORE_RE = re.compile(r"^\s*-?\d+(\.\d+)?\s*$")
+
+def _normalize_grading_result(grading_result):
+    """Fill in missing fields and make sure the score is a number"""
+    # Callers turn ValueError into an error result that keeps the raw reply
+    if not isinstance(grading_result, dict):
+        raise ValueError(f"expected a JSON object, got {type(grading_result).__name__}")
+    
+    # Fill in missing fields (those in RESULT_FIELDS) in one merge; the literal makes fresh lists for every result
+    grading_result = {"score": 0, "feedback": "", "strengths": [], "weaknesses": [], "suggestions": [], **grading_result}
+    
+    # Ensure score is a number; numeric strings are converted, anything else scores 0
+    score = grading_result["score"]
+    if not isinstance(score, (int, float)):
+        grading_result["score"] = float(score) if isinstance(score, str) and _SCORE_RE.match(score) else 0
+    
+    return grading_result
+
+# Token-overlap F1 with the reference answer above or below which a response is scored without the API
+PRESCORE_MATCH_F1 = 0.95
+PRESCORE_OFF_TOPIC_F1 = 0.05
+# Shorter references are too easy to paraphrase ("42" vs "forty two") for word overlap to mean anything
+PRESCORE_MIN_REFERENCE_TOKENS = 20
+
+def token_f1(text, reference):
+    """Token-overlap F1 between two texts, counting repeated words as often as they occur in both"""
+    tokens = Counter(re.findall(r"\w+", text.lower()))
+    reference_tokens = Counter(re.findall(r"\w+", reference.lower()))
+    overlap = sum((tokens & reference_tokens).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(tokens.values())
+    recall = overlap / sum(reference_tokens.values())
+    return 2 * precision * recall / (precision + recall)
+
+def prescore_response(user_response, reference_answer):
+    """
+    Score a response locally when it clearly matches or clearly misses the reference answer.
+    
+    Returns a grading result, or None when the response needs grading by the model.
+    """
+    if not user_response or not reference_answer:
+        return None
+    if len(re.findall(r"\w+", reference_answer)) < PRESCORE_MIN_REFERENCE_TOKENS:
+        return None
+    
+    f1 = token_f1(user_response, reference_answer)
+    if f1 > PRESCORE_MATCH_F1:
+        return {
+            "score": 10,
+            "feedback": "The response matches the reference answer almost word for word.",
+            "strengths": ["Covers the same points as the reference answer"],
+            "weaknesses": [],
+            "suggestions": []
+        }
+    if f1 < PRESCORE_OFF_TOPIC_F1:
+        return {
+            "score": 1,
+            "feedback": "The response shares almost nothing with the reference answer and appears to be off-topic.",
+            "strengths": [],
+            "weaknesses": ["Does not address the points covered by the reference answer"],
+            "suggestions": ["Re-read the question and answer what it asks"]
+        }
+    return None
+
+# Completed gradings are cached on disk, keyed on the model and the full single-response prompt,
+# with the most recently used entries also kept in memory
+GRADE_CACHE_DIR = Path("grade_cache")
+GRADE_CACHE_TTL = 24 * 60 * 60
+GRADE_MEMORY_CACHE_SIZE = 512
+
+_grade_memory_cache = OrderedDict()
+_grade_memory_cache_lock = threading.Lock()
+
+# Cache hits and misses since the process started
+GRADE_CACHE_STATS = {"hits": 0, "misses": 0}
+
+def _copy_grade(grading_result):
+    """Copy a grading result so callers cannot change the cached one"""
+    return {field: list(value) if isinstance(value, list) else value for field, value in grading_result.items()}
+
+def _remember_grade(key, stored_at, grading_result):
+    """Keep a grading result in the in-memory tier, evicting the least recently used entry when full"""
+    with _grade_memory_cache_lock:
+        _grade_memory_cache[key] = (stored_at, grading_result)
+        _grade_memory_cache.move_to_end(key)
+        if len(_grade_memory_cache) > GRADE_MEMORY_CACHE_SIZE:
+            _grade_memory_cache.popitem(last=False)
+
+def _grade_cache_key(model, prompt):
+    """Content address of a grading request"""
+    return hashlib.blake2b(json_dumps([model, prompt], indent=False), digest_size=16).hexdigest()
+
+def _load_cached_grade(key):
+    """Return the cached grading result for a key, or None if it is missing or expired"""
+    now = time.time()
+    with _grade_memory_cache_lock:
+        entry = _grade_memory_cache.get(key)
+        if entry and now - entry[0] <= GRADE_CACHE_TTL:
+            _grade_memory_cache.move_to_end(key)
+            GRADE_CACHE_STATS["hits"] += 1
+            return _copy_grade(entry[1])
+    
+    path = GRADE_CACHE_DIR / f"{key}.json"
+    try:
+        stored_at = path.stat().st_mtime
+        if now - stored_at > GRADE_CACHE_TTL:
+            path.unlink()
+            raise FileNotFoundError(path)
+        with open(path, "rb") as f:
+            grading_result = json_loads(f.read())
+    except (OSError, ValueError):
+        with _grade_memory_cache_lock:
+            GRADE_CACHE_STATS["misses"] += 1
+        return None
+    
+    _remember_grade(key, stored_at, grading_result)
+    with _grade_memory_cache_lock:
+        GRADE_CACHE_STATS["hits"] += 1
+    return _copy_grade(grading_result)
+
+def _is_error_result(grading_result):
+    return grading_result.get("error") is True
+
+def _store_cached_grade(key, grading_result):
+    """Cache a grading result, skipping results that only report an error"""
+    if _is_error_result(grading_result):
+        return
+    _remember_grade(key, time.time(), _copy_grade(grading_result))
+    try:
+        GRADE_CACHE_DIR.mkdir(exist_ok=True)
+        _write_atomic(GRADE_CACHE_DIR / f"{key}.json", json_dumps(grading_result, indent=False))
+    except OSError as e:
+        logger.warning(f"Could not cache grading result: {str(e)}")
+
+def clear_grade_cache():
+    """Delete all cached grading results and return how many were removed"""
+    global _semantic_cache
+    with _grade_memory_cache_lock:
+        _grade_memory_cache.clear()
+    removed = 0
+    if GRADE_CACHE_DIR.exists():
+        for path in GRADE_CACHE_DIR.glob("*.json"):
+            try:
+                path.unlink()
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Could not remove cached grading result {path}: {str(e)}")
+    with _semantic_cache_lock:
+        _semantic_cache = {"setups": np.array([], dtype=str), "embeddings": None, "results": []}
+        try:
+            SEMANTIC_CACHE_FILE.unlink()
+        except OSError:
+            pass
+    return removed
+
+# Near-duplicate responses graded with the same prompt can reuse a grade, found by embedding similarity
+SEMANTIC_CACHE_FILE = GRADE_CACHE_DIR / "semantic.npz"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_MAX_ENTRIES = 10_000
+# Rewriting the whole file on every new entry would be slow, so it is saved at most this often (seconds)
+SEMANTIC_CACHE_SAVE_INTERVAL = 30
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+_semantic_cache_saved = 0.0
+
+def _get_semantic_cache():
+    """Load the semantic cache from disk once per process; call with _semantic_cache_lock held"""
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = {"setups": np.array([], dtype=str), "embeddings": None, "results": []}
+        try:
+            with np.load(SEMANTIC_CACHE_FILE, allow_pickle=False) as data:
+                _semantic_cache = {
+                    "setups": data["setups"],
+                    "embeddings": data["embeddings"],
+                    "results": data["results"].tolist()
+                }
+        except (OSError, KeyError, ValueError) as e:
+            if SEMANTIC_CACHE_FILE.exists():
+                logger.warning(f"Could not load semantic grading cache: {str(e)}")
+    return _semantic_cache
+
+def _semantic_lookup(client, grading_model, prompt_template, user_response):
+    """
+    Look for a grade given to a near-duplicate response with the same grading prompt.
+    
+    Returns (grading_result or None, entry), where entry is passed to _remember_semantic_grade after a miss.
+    """
+    # Import only if needed
+    from index_functions import embed_with_backoff
+    
+    try:
+        response = embed_with_backoff(client, "mistral-embed", [user_response], logger)
+    except Exception as e:
+        logger.warning(f"Could not embed response for the semantic grading cache: {str(e)}")
+        return None, None
+    embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+    embedding /= np.linalg.norm(embedding) or 1.0
+    setup_key = _grade_cache_key(grading_model, prompt_template.template)
+    
+    with _semantic_cache_lock:
+        cache = _get_semantic_cache()
+        if cache["embeddings"] is not None and len(cache["results"]):
+            similarities = np.where(cache["setups"] == setup_key, cache["embeddings"] @ embedding, -1.0)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= SEMANTIC_CACHE_THRESHOLD:
+                GRADE_CACHE_STATS["hits"] += 1
+                return json_loads(cache["results"][best]), None
+    return None, (setup_key, embedding)
+
+def _remember_semantic_grade(entry, grading_result):
+    """Add a newly graded response to the semantic cache, dropping the oldest entries past the limit"""
+    global _semantic_cache_saved
+    if entry is None or _is_error_result(grading_result):
+        return
+    setup_key, embedding = entry
+    
+    with _semantic_cache_lock:
+        cache = _get_semantic_cache()
+        embeddings = embedding[None, :] if cache["embeddings"] is None else np.vstack([cache["embeddings"], embedding])
+        cache["embeddings"] = embeddings[-SEMANTIC_CACHE_MAX_ENTRIES:]
+        cache["setups"] = np.append(cache["setups"], setup_key)[-SEMANTIC_CACHE_MAX_ENTRIES:]
+        cache["results"] = (cache["results"] + [json_dumps(grading_result, indent=False).decode("utf-8")])[-SEMANTIC_CACHE_MAX_ENTRIES:]
+        
+        if time.time() - _semantic_cache_saved < SEMANTIC_CACHE_SAVE_INTERVAL:
+            return
+        buffer = io.BytesIO()
+        np.savez(buffer, setups=cache["setups"], embeddings=cache["embeddings"], results=np.array(cache["results"]))
+        try:
+            GRADE_CACHE_DIR.mkdir(exist_ok=True)
+            _write_atomic(SEMANTIC_CACHE_FILE, buffer.getvalue())
+            _semantic_cache_saved = time.time()
+        except OSError as e:
+            logger.warning(f"Could not save semantic grading cache: {str(e)}")
+
+def _complete_with_backoff(client, max_retries=3, **kwargs):
+    """Request a chat completion, retrying with exponential back-off on rate limits and timeouts"""
+    for attempt in range(max_retries):
+        try:
+            return client.chat.complete(**kwargs)
+        except Exception as e:
+            message = str(e).lower()
+            retryable = getattr(e, "status_code", None) == 429 or "rate limit" in message or "timeout" in message or "timed out" in message
+            if not retryable or attempt == max_retries - 1:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"Grading request failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+# Grading uses a smaller model by default and escalates to the main model when its result looks unusable
+DEFAULT_GRADING_MODEL = "mistral-small-latest"
+
+def _grading_models(config):
+    """Return the model to grade with and the model to escalate to, which is None when they are the same"""
+    grading_model = config.get("grading_model", DEFAULT_GRADING_MODEL)
+    escalation_model = config.get("model", "mistral-large-latest")
+    return grading_model, (escalation_model if escalation_model != grading_model else None)
+
+def _needs_escalation(grading_result):
+    """A zero score or missing feedback usually means the smaller model did not follow the format"""
+    return not grading_result.get("score") or not grading_result.get("feedback")
+
+def _request_grading_reply(client, model, prompt):
+    """Get the reply text for a single-response grading prompt"""
+    request = dict(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.3,  # Lower temperature for more consistent grading
+        max_tokens=GRADING_MAX_TOKENS
+    )
+    # Stream the reply and stop reading once the JSON object is complete
+    try:
+        return _stream_json_reply(client, **request)
+    except Exception as e:
+        logger.warning(f"Streaming grading reply failed ({e}), retrying without streaming")
+        response = _complete_with_backoff(client, **request)
+        return response.choices[0].message.content
+
+class _JsonValueEnd:
+    """Find where the first top-level JSON value ends in text that arrives in pieces, ignoring brackets inside strings"""
+    
+    def __init__(self):
+        self.depth = 0
+        self.in_string = self.escaped = False
+    
+    def feed(self, text):
+        """Return the offset in text just past the end of the value, or None if it has not ended yet"""
+        for i, char in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.depth:
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]" and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    return i + 1
+        return None
+
+def _stream_json_reply(client, **kwargs):
+    """
+    Stream a chat completion and return its text up to the end of the first top-level JSON value.
+    
+    Braces and brackets inside JSON strings are ignored. If the value never closes, the whole reply is returned.
+    """
+    chunks = []
+    value_end = _JsonValueEnd()
+    # Closing the stream on an early return hands its connection back to the shared client's pool
+    with client.chat.stream(**kwargs) as stream:
+        for event in stream:
+            delta = event.data.choices[0].delta.content
+            if not delta:
+                continue
+            end = value_end.feed(delta)
+            if end is not None:
+                # Anything after the JSON value, such as a closing code fence, is never read
+                chunks.append(delta[:end])
+                return "".join(chunks)
+            chunks.append(delta)
+    return "".join(chunks)
+
+def grade_response(user_response, context=None, criteria=None, reference_answer=None, client=None, prompt_template=None):
     """
     Grade a user's response based on specified criteria or a reference answer.
     
@@ -26,18 +555,33 @@ def grade_response(user_response, context=None, criteria=None, reference_answer=
     - criteria: Optional grading criteria (dict or list)
     - reference_answer: Optional reference/model answer to compare against
     - client: Optional Mistral client instance
+    - prompt_template: Optional precompiled prompt from compile_grading_prompt, used instead of
+      building the prompt from context, criteria and reference_answer
     
     Returns:
     Dictionary with grading results
     """
     if not user_response:
-        return {
-            "score": 0,
-            "feedback": "No response provided.",
-            "strengths": [],
-            "weaknesses": [],
-            "suggestions": []
-        }
+        return _empty_response_result()
+    
+    config = _current_config()
+    
+    # Clear matches and misses against the reference answer skip the API call
+    if config.get("local_prescoring", False):
+        prescored = prescore_response(user_response, reference_answer)
+        if prescored:
+            return prescored
+    
+    if prompt_template is None:
+        prompt_template = compile_grading_prompt(context, criteria, reference_answer)
+    prompt = prompt_template.substitute(user_response=user_response)
+    
+    # Identical requests are answered from the disk cache
+    grading_model, escalation_model = _grading_models(config)
+    cache_key = _grade_cache_key(grading_model, prompt)
+    cached = _load_cached_grade(cache_key)
+    if cached:
+        return cached
     
     if client is None:
         client = get_mistral_client()
@@ -45,141 +589,517 @@ def grade_response(user_response, context=None, criteria=None, reference_answer=
             logger.error("Could not initialize Mistral client for grading")
             return None
     
-    config = load_config()
+    # Optionally reuse the grade of a near-duplicate response
+    semantic_entry = None
+    if config.get("semantic_grade_cache", False):
+        similar, semantic_entry = _semantic_lookup(client, grading_model, prompt_template, user_response)
+        if similar:
+            return similar
     
-    # Prepare default criteria if none provided
-    if not criteria:
-        criteria = {
-            "accuracy": "Correctness of the information and concepts",
-            "completeness": "Coverage of all relevant points",
-            "clarity": "Clear explanation and logical structure",
-            "depth": "Depth of understanding and insight"
-        }
+    try:
+        grading_result = parse_grading_reply(_request_grading_reply(client, grading_model, prompt))
+        if escalation_model and _needs_escalation(grading_result):
+            logger.info(f"Escalating grading from {grading_model} to {escalation_model}")
+            grading_result = parse_grading_reply(_request_grading_reply(client, escalation_model, prompt))
+        _store_cached_grade(cache_key, grading_result)
+        _remember_semantic_grade(semantic_entry, grading_result)
+        return grading_result
     
-    # Build the prompt for grading
-    prompt = f"""
-    You are an expert evaluator tasked with grading a user's response objectively and providing constructive feedback.
+    except Exception as e:
+        logger.error(f"Error grading response: {str(e)}")
+        return _error_result(f"Error grading response: {str(e)}")
+
+def _apply_grading_events(partial, events):
+    """Copy the fields completed by a run of ijson parse events into a partial grading result"""
+    for prefix, event, value in events:
+        if prefix in ("score", "feedback") and event in ("number", "string"):
+            partial[prefix] = value
+        elif event == "start_array" and isinstance(RESULT_FIELDS.get(prefix), list):
+            partial[prefix] = []
+        elif event == "string" and prefix.endswith(".item") and isinstance(partial.get(prefix[:-5]), list):
+            partial[prefix[:-5]].append(value)
+
+def grade_response_stream(user_response, context=None, criteria=None, reference_answer=None, client=None, prompt_template=None):
+    """
+    Grade a response like grade_response, yielding partial results while the reply streams in.
     
+    Each partial result holds only the fields completed so far, in the order the model writes them.
+    The last item yielded is the complete grading result. Partial results need ijson; without it,
+    or when the reply is not plain JSON, only the complete result is yielded.
     """
+    if not user_response:
+        yield _empty_response_result()
+        return
     
-    # Add context if provided
-    if context:
-        prompt += f"""
-        CONTEXT/QUESTION:
-        {context}
-        
-        """
+    config = _current_config()
     
-    # Add reference answer if provided
-    if reference_answer:
-        prompt += f"""
-        REFERENCE ANSWER (for comparison):
-        {reference_answer}
-        
-        """
-    
-    # Add criteria for evaluation
-    prompt += "GRADING CRITERIA:\n"
-    if isinstance(criteria, dict):
-        for criterion, description in criteria.items():
-            prompt += f"- {criterion.capitalize()}: {description}\n"
-    elif isinstance(criteria, list):
-        for criterion in criteria:
-            prompt += f"- {criterion}\n"
-    else:
-        prompt += "- Accuracy: Correctness of the information and concepts\n"
-        prompt += "- Completeness: Coverage of all relevant points\n"
-        prompt += "- Clarity: Clear explanation and logical structure\n"
-        prompt += "- Depth: Depth of understanding and insight\n"
+    # Clear matches and misses against the reference answer skip the API call
+    if config.get("local_prescoring", False):
+        prescored = prescore_response(user_response, reference_answer)
+        if prescored:
+            yield prescored
+            return
     
-    # Add the user's response
-    prompt += f"""
-    USER'S RESPONSE TO EVALUATE:
-    {user_response}
+    if prompt_template is None:
+        prompt_template = compile_grading_prompt(context, criteria, reference_answer)
+    prompt = prompt_template.substitute(user_response=user_response)
     
-    INSTRUCTIONS:
-    1. Score the response on a scale of 1-10.
-    2. Provide a brief overall assessment (1-2 sentences).
-    3. List 2-3 strengths of the response.
-    4. List 2-3 areas for improvement.
-    5. Provide 1-2 specific suggestions to improve the response.
-    
-    Format your evaluation as a JSON object with the following structure:
-    {{
-        "score": [score as a number between 1-10],
-        "feedback": "[brief overall assessment]",
-        "strengths": ["strength1", "strength2", ...],
-        "weaknesses": ["weakness1", "weakness2", ...],
-        "suggestions": ["suggestion1", "suggestion2", ...]
-    }}
-    
-    Return ONLY the JSON object, with no additional text.
-    """
+    # Identical requests are answered from the disk cache
+    grading_model, escalation_model = _grading_models(config)
+    cache_key = _grade_cache_key(grading_model, prompt)
+    cached = _load_cached_grade(cache_key)
+    if cached:
+        yield cached
+        return
+    
+    if client is None:
+        client = get_mistral_client()
+        if not client:
+            logger.error("Could not initialize Mistral client for grading")
+            return
+    
+    # Optionally reuse the grade of a near-duplicate response
+    semantic_entry = None
+    if config.get("semantic_grade_cache", False):
+        similar, semantic_entry = _semantic_lookup(client, grading_model, prompt_template, user_response)
+        if similar:
+            yield similar
+            return
+    
+    # Import only if needed
+    try:
+        import ijson
+        events = ijson.sendable_list()
+        parser = ijson.parse_coro(events, use_float=True)
+    except ImportError:
+        parser = None
     
+    partial = {}
+    chunks = []
+    started = False
+    value_end = _JsonValueEnd()
     try:
-        # Get response from Mistral
-        response = client.chat.complete(
-            model=config.get("model", "mistral-large-latest"),
+        with client.chat.stream(
+            model=grading_model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,  # Lower temperature for more consistent grading
-            max_tokens=1000
-        )
-        
-        result_text = response.choices[0].message.content
+            max_tokens=GRADING_MAX_TOKENS
+        ) as stream:
+            for event in stream:
+                delta = event.data.choices[0].delta.content
+                if not delta:
+                    continue
+                # Cut the reply where the JSON value ends, so trailing text never reaches the final parse
+                end = value_end.feed(delta)
+                if end is not None:
+                    delta = delta[:end]
+                chunks.append(delta)
+                
+                # Skip an opening ```json fence, which only ends at the first newline
+                if parser is not None and not started:
+                    head = "".join(chunks).lstrip()
+                    if head and not (head.startswith("`") and "\n" not in head):
+                        delta = head.partition("\n")[2] if head.startswith("```") else head
+                        started = True
+                
+                if parser is not None and started:
+                    try:
+                        parser.send(delta.encode("utf-8"))
+                    except ijson.JSONError:
+                        # Malformed JSON; the complete reply is parsed below instead
+                        parser = None
+                    if events:
+                        _apply_grading_events(partial, events)
+                        del events[:]
+                        if partial:
+                            yield {field: list(value) if isinstance(value, list) else value for field, value in partial.items()}
+                
+                if end is not None:
+                    # The JSON value is complete; skip the rest of the reply
+                    break
+    
+    except Exception as e:
+        logger.error(f"Error grading response: {str(e)}")
+        yield _error_result(f"Error grading response: {str(e)}")
+        return
+    
+    try:
+        grading_result = parse_grading_reply("".join(chunks))
+        # Keep the fields already parsed from the stream if the complete reply still does not parse
+        if "raw_response" in grading_result and "score" in partial:
+            grading_result = _normalize_grading_result(dict(partial))
+        if escalation_model and _needs_escalation(grading_result):
+            logger.info(f"Escalating grading from {grading_model} to {escalation_model}")
+            grading_result = parse_grading_reply(_request_grading_reply(client, escalation_model, prompt))
+    except Exception as e:
+        logger.error(f"Error grading response: {str(e)}")
+        grading_result = _error_result(f"Error grading response: {str(e)}")
+    _store_cached_grade(cache_key, grading_result)
+    _remember_semantic_grade(semantic_entry, grading_result)
+    yield grading_result
+
+def compile_grading_prompt(context=None, criteria=None, reference_answer=None):
+    """Build the single-response grading prompt once, leaving only a $user_response placeholder"""
+    # Escape any $ in the fixed text so only the placeholder is substituted
+    prompt = _build_grading_preamble(context, criteria, reference_answer).replace("$", "$$")
+    
+    # Add the user's response
+    prompt += _SINGLE_RESPONSE_TAIL
+    
+    return string.Template(prompt)
+
+def build_grading_prompt(user_response, context=None, criteria=None, reference_answer=None):
+    """Build the prompt asking for a JSON grading of a single response"""
+    return compile_grading_prompt(context, criteria, reference_answer).substitute(user_response=user_response)
+
+def parse_grading_reply(result_text):
+    """Parse the model's JSON grading reply into a grading result"""
+    # Clean up the response to ensure it's valid JSON
+    result_text = _strip_code_fence(result_text)
+    
+    try:
+        # Valid JSON that is not an object, such as a list or a bare number, raises ValueError too
+        return _normalize_grading_result(json_loads(result_text))
+    except ValueError as e:
+        logger.error(f"Error parsing grading result JSON: {str(e)}")
+        # Return a basic result with the raw response
+        return _error_result("Error parsing grading result.", raw_response=result_text)
+
+def grade_responses(user_responses, context=None, criteria=None, reference_answer=None, client=None, batch_size=5, concurrency=None, prompt_template=None):
+    """
+    Grade several responses to the same question, sending up to batch_size responses per API call.
+    
+    Parameters are the same as grade_response, except user_responses is a list of responses.
+    Up to concurrency API calls (the grading_concurrency setting by default) run at the same time.
+    A prompt_template is only used when there is a single response to grade.
+    
+    Returns:
+    List of grading result dictionaries in the same order as user_responses
+    """
+    if len(user_responses) == 1:
+        grading_result = grade_response(user_responses[0], context, criteria, reference_answer, client, prompt_template)
+        return [grading_result] if grading_result is not None else None
+    
+    if client is None:
+        client = get_mistral_client()
+        if not client:
+            logger.error("Could not initialize Mistral client for grading")
+            return None
+    
+    config = _current_config()
+    if concurrency is None:
+        concurrency = config.get("grading_concurrency", 8)
+    preamble = _build_grading_preamble(context, criteria, reference_answer)
+    
+    # Empty responses and clear matches or misses against the reference answer need no API call
+    prescoring = config.get("local_prescoring", False)
+    results = [
+        _empty_response_result() if not response
+        else prescore_response(response, reference_answer) if prescoring
+        else None
+        for response in user_responses
+    ]
+    
+    # Responses graded before with the same question, criteria and reference come from the disk cache
+    single_prompt = compile_grading_prompt(context, criteria, reference_answer)
+    model = _grading_models(config)[0]
+    cache_keys = {}
+    for i, grading_result in enumerate(results):
+        if grading_result is None:
+            cache_keys[i] = _grade_cache_key(model, single_prompt.substitute(user_response=user_responses[i]))
+            results[i] = _load_cached_grade(cache_keys[i])
+    
+    pending = [i for i, grading_result in enumerate(results) if grading_result is None]
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    
+    def grade_batch(batch):
+        """Grade one batch of responses, returning a result for each index in the batch"""
+        parts = [preamble, """
+    USER RESPONSES TO EVALUATE:
+    """]
+        parts.extend(f"""
+    RESPONSE {number}:
+    {user_responses[i]}
+    """ for number, i in enumerate(batch, 1))
+        parts.append(_BATCH_INSTRUCTIONS_JSON.format(count=len(batch)))
+        prompt = "".join(parts)
         
-        # Extract JSON from the response
         try:
-            # Clean up the response to ensure it's valid JSON
-            result_text = result_text.strip()
-            # Remove any markdown code block indicators
-            if result_text.startswith("```json"):
-                result_text = result_text[7:]
-            if result_text.startswith("```"):
-                result_text = result_text[3:]
-            if result_text.endswith("```"):
-                result_text = result_text[:-3]
-                
-            result_text = result_text.strip()
-            
-            # Parse JSON
-            grading_result = json.loads(result_text)
+            # Get response from Mistral
+            response = _complete_with_backoff(
+                client,
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3,  # Lower temperature for more consistent grading
+                max_tokens=GRADING_MAX_TOKENS * len(batch)
+            )
             
-            # Validate required fields
-            required_fields = ["score", "feedback", "strengths", "weaknesses", "suggestions"]
-            for field in required_fields:
-                if field not in grading_result:
-                    grading_result[field] = [] if field != "score" and field != "feedback" else ""
+            result_text = _strip_code_fence(response.choices[0].message.content)
             
-            # Ensure score is a number
-            if not isinstance(grading_result["score"], (int, float)):
-                try:
-                    grading_result["score"] = float(grading_result["score"])
-                except:
-                    grading_result["score"] = 0
-            
-            return grading_result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Error parsing grading result JSON: {str(e)}")
-            # Return a basic result with the raw response
-            return {
-                "score": 0,
-                "feedback": "Error parsing grading result.",
-                "strengths": [],
-                "weaknesses": [],
-                "suggestions": [],
-                "raw_response": result_text
+            try:
+                batch_results = json_loads(result_text)
+                if not isinstance(batch_results, list) or len(batch_results) != len(batch):
+                    raise ValueError(f"expected a JSON array of {len(batch)} results")
+                return [_normalize_grading_result(grading_result) for grading_result in batch_results]
+            except ValueError as e:
+                logger.error(f"Error parsing batched grading result JSON: {str(e)}")
+                return [_error_result("Error parsing grading result.", raw_response=result_text) for _ in batch]
+        
+        except Exception as e:
+            logger.error(f"Error grading responses: {str(e)}")
+            return [_error_result(f"Error grading response: {str(e)}") for _ in batch]
+    
+    # Batches are independent API calls, so run them concurrently up to the configured limit
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches) or 1))) as executor:
+        for batch, batch_results in zip(batches, executor.map(grade_batch, batches)):
+            for i, grading_result in zip(batch, batch_results):
+                results[i] = grading_result
+                _store_cached_grade(cache_keys[i], grading_result)
+    
+    return results
+
+def grade_responses_bulk(items, client=None, concurrency=None):
+    """
+    Grade many unrelated responses, each with its own question, criteria and reference answer.
+    
+    Parameters:
+    - items: List of dictionaries of grade_response keyword arguments (user_response, context,
+      criteria, reference_answer, prompt_template)
+    - client: Optional Mistral client instance, shared by every request
+    - concurrency: Maximum number of API calls at the same time, the grading_concurrency setting by default
+    
+    Returns:
+    List of grading result dictionaries (or None where grading could not start) in the same order as items
+    """
+    if client is None:
+        client = get_mistral_client()
+        if not client:
+            logger.error("Could not initialize Mistral client for grading")
+            return None
+    
+    if concurrency is None:
+        concurrency = _current_config().get("grading_concurrency", 8)
+    
+    def grade_item(item):
+        return grade_response(client=client, **item)
+    
+    # Each item is an independent API call, so wall time is bounded by the slowest calls rather than their sum
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items) or 1))) as executor:
+        return list(executor.map(grade_item, items))
+
+# Batch grading jobs submitted to the Mistral Batch API are tracked here
+BATCH_DIR = Path("grading_batches")
+BATCH_JOBS_FILE = BATCH_DIR / "jobs.json"
+
+# Batch job statuses after which a job will not change any more
+BATCH_FINAL_STATUSES = {"SUCCESS", "FAILED", "TIMEOUT_EXCEEDED", "CANCELLED"}
+
+# Serializes read-modify-write updates of the jobs file between sessions; the file itself is replaced atomically
+_BATCH_JOBS_LOCK = threading.Lock()
+
+def load_batch_jobs():
+    """Load the batch grading jobs submitted from this app, keyed by job ID"""
+    if not BATCH_JOBS_FILE.exists():
+        return {}
+    try:
+        return json_loads(BATCH_JOBS_FILE.read_bytes())
+    except Exception as e:
+        logger.error(f"Error loading batch grading jobs: {str(e)}")
+        return {}
+
+def _save_batch_jobs(jobs):
+    BATCH_DIR.mkdir(exist_ok=True)
+    _write_atomic(BATCH_JOBS_FILE, json_dumps(jobs))
+
+def _update_batch_jobs(records):
+    """Merge updated job records into the jobs file under the lock, so concurrent updates are not lost"""
+    with _BATCH_JOBS_LOCK:
+        jobs = load_batch_jobs()
+        jobs.update(records)
+        _save_batch_jobs(jobs)
+        return jobs
+
+def submit_grading_batch(user_responses, context=None, criteria=None, reference_answer=None, client=None):
+    """
+    Queue responses for grading through the Mistral Batch API, which runs out-of-band at a lower cost.
+    
+    Each response becomes one chat completion request in a JSONL input file.
+    
+    Returns:
+    The batch job ID, or None if the job could not be submitted
+    """
+    if client is None:
+        client = get_mistral_client()
+        if not client:
+            logger.error("Could not initialize Mistral client for batch grading")
+            return None
+    
+    config = _current_config()
+    model = _grading_models(config)[0]
+    
+    lines = []
+    for i, user_response in enumerate(user_responses):
+        lines.append(json.dumps({
+            "custom_id": str(i),
+            "body": {
+                "messages": [{"role": "user", "content": build_grading_prompt(user_response, context, criteria, reference_answer)}],
+                "temperature": 0.3,
+                "max_tokens": GRADING_MAX_TOKENS
             }
+        }))
     
+    try:
+        input_file = client.files.upload(
+            file={"file_name": "grading_batch.jsonl", "content": ("\n".join(lines) + "\n").encode("utf-8")},
+            purpose="batch"
+        )
+        job = client.batch.jobs.create(
+            input_files=[input_file.id],
+            model=model,
+            endpoint="/v1/chat/completions",
+            metadata={"job_type": "grading"}
+        )
     except Exception as e:
-        logger.error(f"Error grading response: {str(e)}")
-        return {
-            "score": 0,
-            "feedback": f"Error grading response: {str(e)}",
-            "strengths": [],
-            "weaknesses": [],
-            "suggestions": []
-        }
+        logger.error(f"Error submitting batch grading job: {str(e)}")
+        return None
+    
+    _update_batch_jobs({job.id: {
+        "submitted": datetime.datetime.now().isoformat(timespec="seconds"),
+        "count": len(user_responses),
+        "status": job.status,
+        "results_file": None
+    }})
+    return job.id
+
+def refresh_batch_jobs(client=None):
+    """
+    Update the stored status of every unfinished batch grading job, downloading results of jobs that succeeded.
+    
+    The jobs file is read once and written at most once, whatever the number of jobs.
+    
+    Returns:
+    All job records, keyed by job ID
+    """
+    jobs = load_batch_jobs()
+    pending = [job_id for job_id, record in jobs.items() if record["status"] not in BATCH_FINAL_STATUSES]
+    if not pending:
+        return jobs
+    
+    if client is None:
+        client = get_mistral_client()
+        if not client:
+            return jobs
+    
+    # The API calls run outside the lock; only the merge into the file is serialized
+    updated = {}
+    for job_id in pending:
+        record = _refresh_batch_record(job_id, dict(jobs[job_id]), client)
+        if record != jobs[job_id]:
+            updated[job_id] = record
+    return _update_batch_jobs(updated) if updated else jobs
+
+def refresh_batch_job(job_id, client=None):
+    """
+    Update the stored status of a batch grading job, downloading its results once it succeeds.
+    
+    Returns:
+    The updated job record
+    """
+    record = load_batch_jobs().get(job_id)
+    if record is None or record["status"] in BATCH_FINAL_STATUSES:
+        return record
+    
+    if client is None:
+        client = get_mistral_client()
+        if not client:
+            return record
+    
+    updated = _refresh_batch_record(job_id, dict(record), client)
+    if updated != record:
+        _update_batch_jobs({job_id: updated})
+    return updated
+
+def _refresh_batch_record(job_id, record, client):
+    """Fetch a job's status into record, downloading and saving its results once it succeeds"""
+    try:
+        job = client.batch.jobs.get(job_id=job_id)
+        record["status"] = job.status
+        
+        if job.status == "SUCCESS" and job.output_file:
+            output = client.files.download(file_id=job.output_file).read()
+            results = [None] * record["count"]
+            for line in output.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                index = int(entry["custom_id"])
+                body = (entry.get("response") or {}).get("body") or {}
+                if entry.get("error") or not body.get("choices"):
+                    results[index] = _error_result(f"Error grading response: {entry.get('error')}")
+                else:
+                    results[index] = parse_grading_reply(body["choices"][0]["message"]["content"])
+            
+            results_file = BATCH_DIR / f"{job_id}_results.json"
+            _write_atomic(results_file, json_dumps(results))
+            record["results_file"] = str(results_file)
+    except Exception as e:
+        logger.error(f"Error refreshing batch grading job {job_id}: {str(e)}")
+    
+    return record
+
+def load_batch_results(job_id):
+    """Load the downloaded grading results of a finished batch job"""
+    record = load_batch_jobs().get(job_id)
+    if not record or not record.get("results_file"):
+        return None
+    return json_loads(Path(record["results_file"]).read_bytes())
+
+# Criteria lookup tables for create_grading_criteria, read-only so callers cannot change them
+_BASE_CRITERIA = MappingProxyType({
+    "accuracy": "Correctness of the information and concepts",
+    "completeness": "Coverage of all relevant points",
+    "clarity": "Clear explanation and logical structure"
+})
+
+_SUBJECT_CRITERIA = MappingProxyType({
+    "math": MappingProxyType({
+        "methodology": "Correct application of mathematical methods and procedures",
+        "calculation": "Accuracy of calculations and final answers",
+        "problem_solving": "Effectiveness of the approach to solving the problem"
+    }),
+    "science": MappingProxyType({
+        "scientific_thinking": "Application of scientific principles and methods",
+        "evidence_use": "Proper use of evidence to support claims",
+        "concept_application": "Application of scientific concepts to the question"
+    }),
+    "history": MappingProxyType({
+        "historical_context": "Understanding of the historical context",
+        "source_analysis": "Analysis and evaluation of historical sources",
+        "causal_connections": "Identifying cause-and-effect relationships"
+    }),
+    "english": MappingProxyType({
+        "grammar_usage": "Correct grammar, spelling, and punctuation",
+        "expression": "Clarity and effectiveness of expression",
+        "textual_analysis": "Depth of textual analysis and interpretation"
+    }),
+    "programming": MappingProxyType({
+        "code_functionality": "Whether the code works as expected",
+        "code_efficiency": "Efficiency and optimization of the code",
+        "coding_standards": "Adherence to coding conventions and standards"
+    })
+})
+
+_DIFFICULTY_ADDITIONS = MappingProxyType({
+    "easy": MappingProxyType({}),
+    "medium": MappingProxyType({
+        "analysis": "Depth of analysis and critical thinking"
+    }),
+    "hard": MappingProxyType({
+        "analysis": "Depth of analysis and critical thinking",
+        "synthesis": "Integration of concepts and information",
+        "evaluation": "Critical evaluation of different perspectives"
+    })
+})
 
 def create_grading_criteria(subject, difficulty="medium", custom_criteria=None):
     """
@@ -193,71 +1113,38 @@ def create_grading_criteria(subject, difficulty="medium", custom_criteria=None):
     Returns:
     Dictionary of criteria and their descriptions
     """
-    # Base criteria for all subjects
-    base_criteria = {
-        "accuracy": "Correctness of the information and concepts",
-        "completeness": "Coverage of all relevant points",
-        "clarity": "Clear explanation and logical structure"
-    }
-    
-    # Subject-specific criteria
-    subject_criteria = {
-        "math": {
-            "methodology": "Correct application of mathematical methods and procedures",
-            "calculation": "Accuracy of calculations and final answers",
-            "problem_solving": "Effectiveness of the approach to solving the problem"
-        },
-        "science": {
-            "scientific_thinking": "Application of scientific principles and methods",
-            "evidence_use": "Proper use of evidence to support claims",
-            "concept_application": "Application of scientific concepts to the question"
-        },
-        "history": {
-            "historical_context": "Understanding of the historical context",
-            "source_analysis": "Analysis and evaluation of historical sources",
-            "causal_connections": "Identifying cause-and-effect relationships"
-        },
-        "english": {
-            "grammar_usage": "Correct grammar, spelling, and punctuation",
-            "expression": "Clarity and effectiveness of expression",
-            "textual_analysis": "Depth of textual analysis and interpretation"
-        },
-        "programming": {
-            "code_functionality": "Whether the code works as expected",
-            "code_efficiency": "Efficiency and optimization of the code",
-            "coding_standards": "Adherence to coding conventions and standards"
-        }
+    # Base criteria, then subject-specific, difficulty-specific and custom criteria in one merge
+    return {
+        **_BASE_CRITERIA,
+        **_SUBJECT_CRITERIA.get(subject.lower(), {}),
+        **_DIFFICULTY_ADDITIONS.get(difficulty.lower(), {}),
+        **(custom_criteria if isinstance(custom_criteria, dict) else {})
     }
+
+def _write_atomic(path, data, fsync=False):
+    """
+    Write bytes to a temporary file next to path and rename it into place, so readers never see a partial file.
     
-    # Difficulty-specific adjustments
-    difficulty_additions = {
-        "easy": {},
-        "medium": {
-            "analysis": "Depth of analysis and critical thinking"
-        },
-        "hard": {
-            "analysis": "Depth of analysis and critical thinking",
-            "synthesis": "Integration of concepts and information",
-            "evaluation": "Critical evaluation of different perspectives"
-        }
-    }
-    
-    # Start with base criteria
-    criteria = base_criteria.copy()
-    
-    # Add subject-specific criteria if available
-    if subject.lower() in subject_criteria:
-        criteria.update(subject_criteria[subject.lower()])
-    
-    # Add difficulty-specific criteria
-    if difficulty.lower() in difficulty_additions:
-        criteria.update(difficulty_additions[difficulty.lower()])
-    
-    # Add custom criteria if provided
-    if custom_criteria and isinstance(custom_criteria, dict):
-        criteria.update(custom_criteria)
-    
-    return criteria
+    With fsync, the data is flushed to disk before the rename so it also survives a crash.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.urandom(6).hex()}.tmp")
+    # Mode 0666 lets the kernel apply the umask, so the file gets the same permissions as one written with open()
+    fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+# Templates loaded from disk, reused until the templates directory changes
+_TPL_CACHE = {"mtime": -1, "value": {}}
+_TPL_CACHE_LOCK = threading.Lock()
 
 def load_grading_templates():
     """Load grading templates from templates directory."""
@@ -267,15 +1154,28 @@ def load_grading_templates():
     if not templates_dir.exists():
         return templates
     
-    for file_path in templates_dir.glob("*.json"):
+    # Saving or deleting a template renames or removes a directory entry, which updates the directory mtime
+    mtime = templates_dir.stat().st_mtime_ns
+    with _TPL_CACHE_LOCK:
+        if mtime == _TPL_CACHE["mtime"]:
+            return dict(_TPL_CACHE["value"])
+    
+    for file_path in sorted(templates_dir.glob("*.json")):
         try:
-            with open(file_path, "r") as f:
-                template = json.load(f)
-                templates[file_path.stem] = template
+            # Empty files are left behind by interrupted writes and cannot hold a template
+            if file_path.stat().st_size == 0:
+                continue
+            template = json_loads(file_path.read_bytes())
+            # The prompt is compiled once per load, never read from the file, so prompt changes reach saved templates
+            template["prompt_template"] = compile_grading_prompt(template.get("context"), template.get("criteria"), template.get("reference_answer"))
+            templates[file_path.stem] = template
         except Exception as e:
             logger.error(f"Error loading grading template {file_path}: {str(e)}")
     
-    return templates
+    with _TPL_CACHE_LOCK:
+        _TPL_CACHE["mtime"] = mtime
+        _TPL_CACHE["value"] = templates
+    return dict(templates)
 
 def save_grading_template(template_name, criteria, reference_answer=None, context=None):
     """Save a grading template for future use."""
@@ -291,8 +1191,7 @@ def save_grading_template(template_name, criteria, reference_answer=None, contex
     
     try:
         file_path = templates_dir / f"{template_name}.json"
-        with open(file_path, "w") as f:
-            json.dump(template, f, indent=2)
+        _write_atomic(file_path, json_dumps(template), fsync=True)
         return True
     except Exception as e:
         logger.error(f"Error saving grading template {template_name}: {str(e)}")
@@ -7,8 +7,18 @@ setup(
     author="Your Name",
     packages=find_packages(),
     install_requires=[
-        "mistralai",
-        "numpy",
+        "streamlit>=1.37",
+        "mistralai>=1.0",
+        "numpy>=1.20.0",
     ],
+    extras_require={
+        # Optional accelerators; the code checks for each one and falls back without it
+        "fast": [
+            "orjson>=3.9",
+            "ijson>=3.2",
+            "fastjsonschema>=2.16",
+            "httpx[http2]>=0.27",
+        ],
+    },
     python_requires=">=3.8",
 )
\ No newline at end of file